@@ -1,22 +1,50 @@
-import numpy as np, librosa, os, subprocess
+import numpy as np, os, threading
+import procman
+import resources
+
+_WAV_LOCK = threading.Lock()
 
 def ensure_wav(src_video: str, wav_path: str, sr=16000):
-    if os.path.exists(wav_path):
-        return wav_path
-    # extract mono wav
-    subprocess.run([
-        "ffmpeg","-y","-i",src_video,
-        "-ac","1","-ar",str(sr),
-        wav_path
-    ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    """Mono wav of the source; re-extracted when the source is newer (a growing --tail recording)."""
+    with _WAV_LOCK:
+        if os.path.exists(wav_path) and os.path.getmtime(wav_path) >= os.path.getmtime(src_video):
+            return wav_path
+        # extract mono wav next to it, then swap it in for readers of the old one
+        tmp = os.path.splitext(wav_path)[0] + ".tmp.wav"
+        procman.run([
+            "ffmpeg","-y","-i",src_video,
+            "-ac","1","-ar",str(sr),
+            tmp
+        ])
+        os.replace(tmp, wav_path)
     return wav_path
 
+def rms_envelope(audio_path, sr_target=16000, frame_ms=250, hop_ms=125):
+    """(times, rms) over the whole file; cached next to the wav as <name>.rms<frame>_<hop>.npz."""
+    cache = f"{os.path.splitext(audio_path)[0]}.rms{frame_ms}_{hop_ms}.npz"
+    if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(audio_path):
+        d = np.load(cache)
+        return d["times"], d["rms"]
+    # the whole file is held as float32: admit it against the node RAM budget by length
+    minutes = os.path.getsize(audio_path) / (sr_target * 2 * 60.0)
+    import librosa   # only needed to (re)build the cache
+    with resources.admit("audio", units=minutes):
+        y, sr = librosa.load(audio_path, sr=sr_target, mono=True)
+        frame = int(sr*frame_ms/1000)
+        hop = int(sr*hop_ms/1000)
+        rms = librosa.feature.rms(y=y, frame_length=frame, hop_length=hop).flatten()
+        times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop, n_fft=frame)
+        del y
+    tmp = cache + ".tmp.npz"
+    np.savez(tmp, times=times, rms=rms)
+    os.replace(tmp, cache)
+    return times, rms
+
 def energy_peaks(audio_path, sr_target=16000, frame_ms=250, hop_ms=125, zscore=1.2):
-    y, sr = librosa.load(audio_path, sr=sr_target, mono=True)
-    frame = int(sr*frame_ms/1000)
-    hop = int(sr*hop_ms/1000)
-    rms = librosa.feature.rms(y=y, frame_length=frame, hop_length=hop).flatten()
-    times = librosa.frames_to_time(np.arange(len(rms)), sr=sr, hop_length=hop, n_fft=frame)
+    times, rms = rms_envelope(audio_path, sr_target, frame_ms, hop_ms)
+    return peaks_from_envelope(times, rms, zscore)
+
+def peaks_from_envelope(times, rms, zscore=1.2):
     mu, sd = rms.mean(), rms.std() + 1e-9
     peaks = [(float(t), float(r)) for t, r in zip(times, rms) if (r-mu)/sd >= zscore]
     return peaks
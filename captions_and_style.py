@@ -1,4 +1,5 @@
-import os, re, subprocess
+import os, re, subprocess, yaml
+import procman
 
 def _fmt_time(s):
     h = int(s//3600); m = int((s%3600)//60); sec = int(s%60); ms = int(round((s-int(s))*1000))
@@ -28,13 +29,17 @@ def _parse_srt(path):
         out.append({"start":start,"end":end,"text":text})
     return out
 
-def _write_clip_srt(lines, clip_start, clip_end, out_path):
+def _write_clip_srt(lines, clip_start, clip_end, out_path, keeps=None):
     keep = []
     for ln in lines:
         s = max(ln["start"], clip_start)
         e = min(ln["end"], clip_end)
         if e > s:
             keep.append({"start": s-clip_start, "end": e-clip_start, "text": ln["text"]})
+    if keeps:
+        # clip has jump cuts: move captions onto the shortened timeline
+        from jumpcuts import retime_lines
+        keep = retime_lines(keep, keeps)
     if not keep:
         return False
     with open(out_path, "w", encoding="utf-8") as f:
@@ -46,10 +51,47 @@ def _ffmpeg_escape_filter_path(p: str) -> str:
     p = p.replace("\\", "/").replace("'", r"\'").replace(",", r"\,")
     return p
 
-def style_clips(work_dir, config_path):
+def caption_style(cap_cfg, width=1080, height=1920, overrides=None):
+    """
+    force_style for the subtitles filter. Sizes are in libass script units (the SRT
+    canvas is 288 high, scaled to the video height), so the font is scaled by the
+    short side relative to a 1080x1920 portrait frame to keep the same pixel size
+    across 9:16, 1:1 and 16:9; non-portrait layouts sit captions lower.
+    """
+    cap = dict(cap_cfg or {})
+    cap.update(overrides or {})
+    portrait = height > width
+    k = (min(width, height) / float(height)) / (1080.0 / 1920.0)
+    font      = cap.get("font", "Arial")
+    font_size = int(cap["font_size"]) if "font_size" in (overrides or {}) else round(float(cap.get("font_size", 38)) * k)
+    outline   = int(cap.get("outline", 3))
+    margin_v  = int(cap.get("margin_v", 110))
+    if not portrait and "margin_v" not in (overrides or {}):
+        margin_v = round(margin_v * 0.3)
+    return (f"Fontname={font},Fontsize={font_size},Outline={outline},BorderStyle=3,"
+            f"PrimaryColour=&H00FFFFFF&,BackColour=&H7F000000&,Alignment=2,MarginV={margin_v}")
+
+def subtitles_filter(srt_path, style):
+    return f"subtitles='{_ffmpeg_escape_filter_path(srt_path)}':force_style='{style}'"
+
+def write_clip_srt(work_dir, clip_start, clip_end, out_path, keeps=None):
+    """
+    Clip-relative SRT cut from <work_dir>/transcript.srt; False if nothing overlaps.
+    keeps: clip-relative keep-intervals when the clip has jump cuts (jumpcuts.py).
+    """
+    subs = _parse_srt(os.path.join(work_dir, "transcript.srt"))
+    return bool(subs) and _write_clip_srt(subs, clip_start, clip_end, out_path, keeps)
+
+def style_clips(work_dir, config_path, on_final=None):
+    """
+    Burns captions into every clip_NNN.mp4 -> clip_NNN_final.mp4.
+    on_final(path) is called for each final clip as soon as it exists (in clip order).
+    Returns the list of final paths.
+    """
     print("\n💬 Styling clips (captions)…")
     clips_dir = os.path.join(work_dir, "clips")
-    if not os.path.isdir(clips_dir): return
+    finals = []
+    if not os.path.isdir(clips_dir): return finals
 
     master_srt = os.path.join(work_dir, "transcript.srt")
     subs = _parse_srt(master_srt)
@@ -60,10 +102,13 @@ def style_clips(work_dir, config_path):
         with open(hi_path,"r",encoding="utf-8") as f:
             highlights = json.load(f)
 
-    style = "Fontname=Arial,Fontsize=38,Outline=3,BorderStyle=3,PrimaryColour=&H00FFFFFF&,BackColour=&H7F000000&,Alignment=2,MarginV=110"
+    with open(config_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    enc = cfg.get("encode", {}) or {}
+    style = caption_style(cfg.get("captions", {}), int(enc.get("width", 1080)), int(enc.get("height", 1920)))
 
     for f in sorted(os.listdir(clips_dir)):
-        if not (f.endswith(".mp4") and not f.endswith("_final.mp4")):
+        if not (f.endswith(".mp4") and not f.endswith("_final.mp4")) or ".part" in f:
             continue
         src = os.path.join(clips_dir, f)
         dst = os.path.join(clips_dir, f.replace(".mp4", "_final.mp4"))
@@ -77,12 +122,18 @@ def style_clips(work_dir, config_path):
         if idx is not None and idx < len(highlights) and subs:
             h = highlights[idx]
             clip_srt = os.path.join(clips_dir, f"clip_{idx+1:03}.srt")
-            ok = _write_clip_srt(subs, float(h["start"]), float(h["end"]), clip_srt)
+            cs, ce, keeps = float(h["start"]), float(h["end"]), None
+            if os.path.isfile(os.path.join(clips_dir, f"clip_{idx+1:03}.keep.json")):
+                # jump-cut clip: use the encoded range and its keep-map
+                from jumpcuts import load_keeps
+                km = load_keeps(work_dir, idx + 1) or {}
+                cs, ce, keeps = float(km.get("start", cs)), float(km.get("end", ce)), km.get("keep")
+            ok = _write_clip_srt(subs, cs, ce, clip_srt, keeps)
             if not ok:
                 clip_srt = None
 
         if clip_srt and os.path.isfile(clip_srt):
-            vf = f"subtitles='{_ffmpeg_escape_filter_path(clip_srt)}':force_style='{style}'"
+            vf = subtitles_filter(clip_srt, style)
             cmd = [
                 "ffmpeg","-y","-i",src,
                 "-vf", vf,
@@ -92,10 +143,12 @@ def style_clips(work_dir, config_path):
                 dst
             ]
             try:
-                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                procman.run(cmd, duration=float(h["end"]) - float(h["start"]))
+                finals.append(dst)
+                if on_final: on_final(dst)
                 continue
-            except subprocess.CalledProcessError:
-                pass
+            except subprocess.CalledProcessError as e:
+                print(f"⚠️ captions failed for {f}: {e}")
 
         # fallback: just rename to *_final
         base, ext = os.path.splitext(f)
@@ -108,3 +161,6 @@ def style_clips(work_dir, config_path):
                     out = cand; break
                 n += 1
         os.rename(src, out)
+        finals.append(out)
+        if on_final: on_final(out)
+    return finals
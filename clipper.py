@@ -1,13 +1,105 @@
-import os, subprocess, yaml, time
+import os, subprocess, yaml, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+import procman
+from captions_and_style import caption_style, subtitles_filter, write_clip_srt
+import loudness
 
 def _sec(x):
     return max(0.0, float(x))
 
-def cut_clips(video_path, highlights, work_dir, config_path):
-    print("\n✂️ Cutting clips...")
+def _clip_range(hl, enc):
+    s = max(0.0, _sec(hl["start"]) - float(enc.get("pad_in", 0.15)))
+    e = _sec(hl["end"]) + float(enc.get("pad_out", 0.20))
+    return s, e, max(0.01, e - s)
+
+def _reframe_enabled(cfg):
+    return bool((cfg.get("reframe", {}) or {}).get("enabled", False))
+
+def _reframe_crop(video_path, s, e, W, H, work_dir, cfg):
+    """Subject-tracking crop filter for this range, or None (falls back to letterbox)."""
+    try:
+        import reframe
+        return reframe.crop_filter(video_path, s, e, W, H, work_dir, cfg)
+    except Exception as ex:
+        print(f"⚠️ reframe skipped: {ex}")
+        return None
+
+def prepare_analysis(video_path, highlights, work_dir, cfg, measure_loudness=True):
+    """
+    Per-source analysis the clip encodes read from cache: the loudness timeline and
+    (if enabled) reframe paths for every range. Run once before fanning clips out.
+    """
+    if not highlights:
+        return
+    enc = cfg.get("encode", {}) or {}
+    if measure_loudness and loudness.static_enabled(cfg) and (enc.get("mode") or "nvenc").lower() != "copy":
+        try:
+            loudness.measure(video_path, work_dir)
+        except Exception as ex:
+            print(f"⚠️ loudness measurement skipped: {ex}")
+    if _reframe_enabled(cfg):
+        # analyse every range up front, in parallel; cut_clip then hits the cache
+        try:
+            import reframe
+            t0 = time.time()
+            reframe.prepare_paths(video_path, [_clip_range(h, enc)[:2] for h in highlights], work_dir, cfg)
+            print(f"  • reframe paths for {len(highlights)} clip(s) in {time.time()-t0:.1f}s")
+        except Exception as ex:
+            print(f"⚠️ reframe analysis skipped: {ex}")
+
+def _jumpcuts(video_path, s, e, i, work_dir, cfg, sub="clips"):
+    """Keep-intervals for clip i (also recorded in <work_dir>/<sub> for the caption pass), or None."""
+    keeps = None
+    try:
+        import jumpcuts
+        if jumpcuts.enabled(cfg):
+            keeps = jumpcuts.keep_intervals(video_path, s, e, work_dir, cfg)
+        jumpcuts.save_keeps(work_dir, i, s, e, keeps, sub)
+    except Exception as ex:
+        print(f"⚠️ jump cuts skipped for clip_{i:03}: {ex}")
+    return keeps
+
+def _part_path(final_path):
+    """Temp name unique to this writer: after a stolen lease two nodes may encode the same clip."""
+    return f"{os.path.splitext(final_path)[0]}.part-{uuid.uuid4().hex[:8]}.mp4"
+
+def _discard(paths):
+    for p in paths:
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+
+def _load_cfg(config_path):
     with open(config_path, "r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f) or {}
+        return yaml.safe_load(f) or {}
+
+def cut_clips(video_path, highlights, work_dir, config_path, numbers=None):
+    """numbers: clip numbers to use instead of 1..N (e.g. approved IDs on --finalize)."""
+    print("\n✂️ Cutting clips...")
+    cfg = _load_cfg(config_path)
+    numbers = list(numbers) if numbers else range(1, len(highlights) + 1)
+    prepare_analysis(video_path, highlights, work_dir, cfg)
+    map_clips(lambda i, hl: cut_clip(video_path, hl, i, work_dir, cfg), numbers, highlights, cfg)
+
+def map_clips(fn, numbers, highlights, cfg):
+    """fn(i, hl) for every clip, side by side; procman enforces the global process limit."""
+    workers = int((cfg.get("process", {}) or {}).get("max_concurrent", 2))
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        return list(ex.map(fn, numbers, highlights))
+
+def cut_clip(video_path, hl, i, work_dir, cfg, before_publish=None):
+    """
+    Encode one highlight to <work_dir>/clips/clip_NNN.mp4.
+    Written to a per-writer temp name and renamed, so a duplicate run (e.g. after a
+    stolen queue lease) never leaves a half-written or mixed clip behind.
+    With encode.renditions set, this fans out to cut_renditions instead.
+    before_publish: called right before the rename (e.g. Lease.verify); raising keeps the
+    clip unpublished.
+    """
     enc = cfg.get("encode", {}) or {}
+    if renditions(enc):
+        return cut_renditions(video_path, hl, i, work_dir, cfg, before_publish=before_publish)
 
     mode      = (enc.get("mode") or "nvenc").lower()  # "nvenc" or "copy"
     W         = int(enc.get("width", 1080))
@@ -29,76 +121,238 @@ def cut_clips(video_path, highlights, work_dir, config_path):
     a_bitrate = str(enc.get("audio_bitrate", "192k"))
     a_rate    = str(enc.get("audio_rate", 48000))
 
-    pad_in    = float(enc.get("pad_in", 0.15))
-    pad_out   = float(enc.get("pad_out", 0.20))
-
     clips_dir = os.path.join(work_dir, "clips")
     os.makedirs(clips_dir, exist_ok=True)
 
+    s, e, dur = _clip_range(hl, enc)
+
     # portrait scale/pad + yuv420p
     vf_base = (
         f"fps={FPS},scale=w={W}:h={H}:force_original_aspect_ratio=decrease:flags=lanczos,"
         f"format=yuv420p,pad={W}:{H}:(ow-iw)/2:(oh-ih)/2:black"
     )
+    # subject-tracking crop instead of black bars
+    crop = _reframe_crop(video_path, s, e, W, H, work_dir, cfg) if _reframe_enabled(cfg) and mode != "copy" else None
+    if crop:
+        vf_base = f"fps={FPS},{crop},scale={W}:{H}:flags=lanczos,format=yuv420p"
+    af = loudness.clip_filter(video_path, s, e, work_dir, cfg) if mode != "copy" else None
+    # dead-air removal rides along in the same encode
+    keeps = _jumpcuts(video_path, s, e, i, work_dir, cfg) if mode != "copy" else None
+    if keeps:
+        import jumpcuts
+        vf_base += "," + jumpcuts.video_filter(keeps)
+        af = jumpcuts.audio_filter(keeps) + "," + af
 
-    for i, hl in enumerate(highlights, start=1):
-        s = _sec(hl["start"]) - pad_in
-        s = max(0.0, s)
-        e = _sec(hl["end"]) + pad_out
-        dur = max(0.01, e - s)
+    final_path = os.path.join(clips_dir, f"clip_{i:03}.mp4")
+    outpath = _part_path(final_path)
+    t0 = time.time()
 
-        outpath = os.path.join(clips_dir, f"clip_{i:03}.mp4")
-        t0 = time.time()
+    if mode == "copy":
+        cmd = [
+            "ffmpeg","-y",
+            "-ss", f"{s:.3f}", "-i", video_path,
+            "-t",  f"{dur:.3f}",
+            "-c","copy","-movflags","+faststart",
+            outpath
+        ]
+    else:
+        cmd = [
+            "ffmpeg","-y",
+            "-ss", f"{s:.3f}", "-t", f"{dur:.3f}", "-i", video_path,
+            "-vf", vf_base,
+            "-c:v","h264_nvenc",
+            "-rc:v", rc,
+            "-cq", cq,
+            "-b:v", b_v,
+            "-maxrate", maxrate,
+            "-bufsize", bufsize,
+            "-preset", preset,
+            "-profile:v", profile,
+            "-g", gop,
+            "-bf", bf,
+            "-spatial_aq", aq,
+            "-aq-strength", aq_str,
+            "-pix_fmt","yuv420p",
+            "-c:a","aac","-b:a", a_bitrate, "-ar", str(a_rate),
+            "-af", af,
+            "-movflags","+faststart",
+            outpath
+        ]
 
-        if mode == "copy":
-            cmd = [
-                "ffmpeg","-y",
-                "-ss", f"{s:.3f}", "-i", video_path,
-                "-t",  f"{dur:.3f}",
-                "-c","copy","-movflags","+faststart",
-                outpath
-            ]
-        else:
-            cmd = [
+    try:
+        try:
+            procman.run(cmd, duration=dur)
+        except subprocess.CalledProcessError as ex:
+            print(f"⚠️ clip_{i:03}: {mode} encode failed, retrying with libx264\n{getattr(ex, 'tail', '')}")
+            cmd_fallback = [
                 "ffmpeg","-y",
-                "-ss", f"{s:.3f}", "-i", video_path,
-                "-t",  f"{dur:.3f}",
+                "-ss", f"{s:.3f}", "-t", f"{dur:.3f}", "-i", video_path,
                 "-vf", vf_base,
-                "-c:v","h264_nvenc",
-                "-rc:v", rc,
-                "-cq", cq,
-                "-b:v", b_v,
-                "-maxrate", maxrate,
-                "-bufsize", bufsize,
-                "-preset", preset,
-                "-profile:v", profile,
-                "-g", gop,
-                "-bf", bf,
-                "-spatial_aq", aq,
-                "-aq-strength", aq_str,
+                "-c:v","libx264","-crf","19","-preset","faster",
                 "-pix_fmt","yuv420p",
                 "-c:a","aac","-b:a", a_bitrate, "-ar", str(a_rate),
-                "-af","loudnorm=I=-16:TP=-1.5:LRA=11",
+                "-af", af,
                 "-movflags","+faststart",
                 outpath
             ]
+            procman.run(cmd_fallback, duration=dur)
+        if before_publish is not None:
+            before_publish()
+        os.replace(outpath, final_path)
+    finally:
+        _discard([outpath])
 
-        try:
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        except subprocess.CalledProcessError:
-            cmd_fallback = [
-                "ffmpeg","-y",
-                "-ss", f"{s:.3f}", "-i", video_path,
-                "-t",  f"{dur:.3f}",
-                "-vf", vf_base,
-                "-c:v","libx264","-crf","19","-preset","faster",
+    dt = time.time() - t0
+    cut = f", {dur - sum(b - a for a, b in keeps):.1f}s cut" if keeps else ""
+    print(f"  • clip_{i:03}.mp4  ({dur:.1f}s{cut})  done in {dt:.1f}s [{mode}]")
+    return final_path
+
+# --------------------------- multi-rendition ladder ---------------------------
+
+def renditions(enc):
+    """
+    Normalized encode.renditions list ([] = single legacy output). Each entry:
+      {name, width, height, fps?, fit?: pad|crop|reframe, codec: nvenc|x264,
+       cq?, b_v?, maxrate?, bufsize?, preset?, crf?, x264_preset?, gop?, audio_bitrate?, captions?}
+    Unset encoder knobs inherit from the encode section; unset fit means reframe when
+    reframe.enabled, else pad.
+    """
+    out = []
+    for r in enc.get("renditions") or []:
+        r = dict(r)
+        r["width"], r["height"] = int(r["width"]), int(r["height"])
+        r.setdefault("name", f"{r['width']}x{r['height']}")
+        r.setdefault("fps", int(enc.get("fps", 60)))
+        r.setdefault("codec", "x264" if (enc.get("mode") or "nvenc").lower() == "x264" else "nvenc")
+        out.append(r)
+    return out
+
+def rendition_finals(work_dir, cfg):
+    """Final clips of the first (primary) rendition, in clip order; [] without renditions."""
+    rs = renditions(cfg.get("encode", {}) or {})
+    clips_dir = os.path.join(work_dir, "clips")
+    if not rs or not os.path.isdir(clips_dir):
+        return []
+    suffix = f"_{rs[0]['name']}_final.mp4"
+    return [os.path.join(clips_dir, f) for f in sorted(os.listdir(clips_dir))
+            if f.startswith("clip_") and f.endswith(suffix)]
+
+def _fit_filter(r, crop=None):
+    W, H, FPS = r["width"], r["height"], int(r["fps"])
+    if crop:
+        return f"fps={FPS},{crop},scale={W}:{H}:flags=lanczos,format=yuv420p"
+    if r.get("fit") == "crop":
+        return (f"fps={FPS},scale=w={W}:h={H}:force_original_aspect_ratio=increase:flags=lanczos,"
+                f"crop={W}:{H},format=yuv420p")
+    return (f"fps={FPS},scale=w={W}:h={H}:force_original_aspect_ratio=decrease:flags=lanczos,"
+            f"format=yuv420p,pad={W}:{H}:(ow-iw)/2:(oh-ih)/2:black")
+
+def _video_args(enc, r, codec):
+    get = lambda k, d: str(r.get(k, enc.get(k, d)))
+    if codec == "nvenc":
+        return [
+            "-c:v","h264_nvenc",
+            "-rc:v", get("rc", "vbr_hq"),
+            "-cq", get("cq", 19),
+            "-b:v", get("b_v", "8M"),
+            "-maxrate", get("maxrate", "12M"),
+            "-bufsize", get("bufsize", "24M"),
+            "-preset", get("preset", "p5"),
+            "-profile:v", get("profile", "high"),
+            "-g", get("gop", 120),
+            "-bf", get("bf", 3),
+            "-spatial_aq", get("aq", 1),
+            "-aq-strength", get("aq_strength", 8),
+        ]
+    return [
+        "-c:v","libx264",
+        "-crf", get("crf", 19),
+        "-preset", str(r.get("x264_preset", "faster")),
+        "-maxrate", get("maxrate", "12M"),
+        "-bufsize", get("bufsize", "24M"),
+        "-g", get("gop", 120),
+    ]
+
+def cut_renditions(video_path, hl, i, work_dir, cfg, rs=None, outputs=None, audio_filter=None,
+                   before_publish=None, sub="clips"):
+    """
+    One decode per clip, fanned out with split/asplit into every rendition, each
+    captioned in the same graph with a layout-appropriate style. Writes
+    clip_NNN_<name>_final.mp4 per rendition (already final; style_clips skips them).
+    rs/outputs/audio_filter override the configured ladder, output paths and clip gain;
+    sub is the work_dir folder for the clip's side files (.srt, .keep.json).
+    """
+    enc = cfg.get("encode", {}) or {}
+    rs = rs or renditions(enc)
+    a_bitrate = str(enc.get("audio_bitrate", "192k"))
+    a_rate    = str(enc.get("audio_rate", 48000))
+
+    clips_dir = os.path.join(work_dir, sub)
+    os.makedirs(clips_dir, exist_ok=True)
+
+    s, e, dur = _clip_range(hl, enc)
+    if audio_filter is None:
+        audio_filter = loudness.clip_filter(video_path, s, e, work_dir, cfg)
+    keeps = _jumpcuts(video_path, s, e, i, work_dir, cfg, sub)
+    cut_v = cut_a = ""
+    if keeps:
+        import jumpcuts
+        cut_v = "," + jumpcuts.video_filter(keeps)
+        cut_a = jumpcuts.audio_filter(keeps) + ","
+
+    srt = os.path.join(clips_dir, f"clip_{i:03}.srt")
+    has_subs = write_clip_srt(work_dir, s, e, srt, keeps)
+
+    n = len(rs)
+    graph = [f"[0:v]split={n}" + "".join(f"[s{k}]" for k in range(n))]
+    for k, r in enumerate(rs):
+        fit = r.get("fit") or ("reframe" if _reframe_enabled(cfg) else "pad")
+        crop = _reframe_crop(video_path, s, e, r["width"], r["height"], work_dir, cfg) if fit == "reframe" else None
+        chain = _fit_filter(r, crop) + cut_v   # cut after the crop path, before captions
+        if has_subs:
+            style = caption_style(cfg.get("captions", {}), r["width"], r["height"], r.get("captions"))
+            chain += "," + subtitles_filter(srt, style)
+        graph.append(f"[s{k}]{chain}[v{k}]")
+    graph.append(f"[0:a]{cut_a}{audio_filter},asplit={n}" + "".join(f"[a{k}]" for k in range(n)))
+
+    finals = outputs or [os.path.join(clips_dir, f"clip_{i:03}_{r['name']}_final.mp4") for r in rs]
+    parts = [_part_path(p) for p in finals]
+
+    def build(force_x264):
+        cmd = [
+            "ffmpeg","-y",
+            "-ss", f"{s:.3f}", "-t", f"{dur:.3f}", "-i", video_path,
+            "-filter_complex", ";".join(graph),
+        ]
+        for k, r in enumerate(rs):
+            codec = "x264" if force_x264 else r["codec"]
+            cmd += ["-map", f"[v{k}]", "-map", f"[a{k}]"]
+            cmd += _video_args(enc, r, codec)
+            cmd += [
                 "-pix_fmt","yuv420p",
-                "-c:a","aac","-b:a", a_bitrate, "-ar", str(a_rate),
-                "-af","loudnorm=I=-16:TP=-1.5:LRA=11",
+                "-c:a","aac","-b:a", str(r.get("audio_bitrate", a_bitrate)), "-ar", a_rate,
                 "-movflags","+faststart",
-                outpath
+                parts[k]
             ]
-            subprocess.run(cmd_fallback, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return cmd
+
+    t0 = time.time()
+    try:
+        try:
+            procman.run(build(False), duration=dur * n)
+        except subprocess.CalledProcessError as ex:
+            if all(r["codec"] == "x264" for r in rs):
+                raise
+            print(f"⚠️ clip_{i:03}: nvenc encode failed, retrying with libx264\n{getattr(ex, 'tail', '')}")
+            procman.run(build(True), duration=dur * n)
+        if before_publish is not None:
+            before_publish()
+        for part, final in zip(parts, finals):
+            os.replace(part, final)
+    finally:
+        _discard(parts)
 
-        dt = time.time() - t0
-        print(f"  • clip_{i:03}.mp4  ({dur:.1f}s)  done in {dt:.1f}s [{mode}]")
+    dt = time.time() - t0
+    names = ",".join(r["name"] for r in rs)
+    print(f"  • clip_{i:03} [{names}]  ({dur:.1f}s)  done in {dt:.1f}s (1 decode, {n} outputs)")
+    return finals[0]
@@ -0,0 +1,115 @@
+# corpus_idf.py
+# Persistent, channel-wide document frequencies for hook rarity scoring.
+#
+# Tokens are hashed (crc32) into a fixed number of buckets; counts live in a flat uint32 file
+# that is memory-mapped for reading, so lookups are a vectorized gather. Updates are a
+# read-modify-write of the file itself under the lock: over NFS, mapped pages are not re-read
+# after flock, so incrementing the mapping would drop other nodes' counts. Slot 0 holds the
+# number of documents. Collisions only make a token look slightly more common, which is the
+# safe direction for a rarity bonus.
+#
+#   <root>/df.u32     (buckets + 1) x uint32
+#   <root>/docs.txt   keys of transcripts already counted (re-runs don't double count)
+
+import os, zlib, hashlib
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:   # Windows: single-writer only
+    fcntl = None
+
+class _Lock:
+    def __init__(self, path: str):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, "a+")
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.f.fileno(), fcntl.LOCK_UN)
+        self.f.close()
+        return False
+
+class CorpusIDF:
+    def __init__(self, root: str, buckets: int = 1 << 20, min_docs: int = 5):
+        self.root = root
+        self.buckets = int(buckets)
+        self.min_docs = int(min_docs)
+        os.makedirs(root, exist_ok=True)
+        self.df_path = os.path.join(root, "df.u32")
+        self.docs_path = os.path.join(root, "docs.txt")
+        self.lock_path = os.path.join(root, ".lock")
+        with _Lock(self.lock_path):
+            if not os.path.isfile(self.df_path):
+                np.memmap(self.df_path, dtype=np.uint32, mode="w+", shape=(self.buckets + 1,)).flush()
+        size = os.path.getsize(self.df_path) // 4 - 1
+        if size != self.buckets:
+            self.buckets = size   # the file decides; changing buckets needs a fresh store
+        self.df = self._map()
+
+    def _map(self) -> np.memmap:
+        return np.memmap(self.df_path, dtype=np.uint32, mode="r", shape=(self.buckets + 1,))
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> Optional["CorpusIDF"]:
+        c = ((cfg.get("scoring", {}) or {}).get("corpus_idf", {}) or {})
+        if not c.get("enabled", False):
+            return None
+        return cls(c.get("path", os.path.join("work", "_corpus")),
+                   buckets=int(c.get("buckets", 1 << 20)),
+                   min_docs=int(c.get("min_docs", 5)))
+
+    @property
+    def n_docs(self) -> int:
+        return int(self.df[0])
+
+    def _slots(self, tokens: Iterable[str]) -> np.ndarray:
+        return np.fromiter((1 + zlib.crc32(t.encode("utf-8")) % self.buckets for t in tokens),
+                           dtype=np.int64)
+
+    def idf(self, tokens: List[str]) -> Dict[str, float]:
+        """Smoothed corpus IDF for each distinct token, in one gather."""
+        uniq = list(set(tokens))
+        if not uniq:
+            return {}
+        counts = self.df[self._slots(uniq)].astype(np.float64)
+        vals = np.log((self.n_docs + 1.0) / (counts + 1.0))
+        return dict(zip(uniq, vals.tolist()))
+
+    def weight(self, base: float) -> float:
+        """Blend weight, ramped up until the corpus holds min_docs transcripts."""
+        if self.min_docs <= 0:
+            return base
+        return base * min(1.0, self.n_docs / float(self.min_docs))
+
+    def add_document(self, key: str, tokens: Iterable[str]) -> bool:
+        """Count one transcript's distinct tokens once. Returns False if key was already counted."""
+        with _Lock(self.lock_path):
+            if os.path.isfile(self.docs_path):
+                with open(self.docs_path, "r", encoding="utf-8") as f:
+                    if key in {l.strip() for l in f}:
+                        return False
+            slots = np.unique(self._slots(set(tokens)))
+            with open(self.df_path, "r+b") as f:
+                counts = np.fromfile(f, dtype=np.uint32, count=self.buckets + 1)
+                counts[slots] += 1
+                counts[0] += 1
+                f.seek(0)
+                f.write(counts.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.docs_path, "a", encoding="utf-8") as f:
+                f.write(key + "\n")
+        self.df = self._map()   # fresh mapping with everyone's counts
+        return True
+
+def document_key(name: str, transcript: List[Dict]) -> str:
+    h = hashlib.sha1("\n".join(t.get("text", "") for t in transcript).encode("utf-8")).hexdigest()[:16]
+    return f"{name}:{h}"
@@ -1,8 +1,9 @@
 import os, json, yaml, time
 from typing import List, Dict
-from hook_mixer import find_hooks, refine_hook_boundaries
+from hook_mixer import find_hooks, refine_hook_boundaries, content_tokens, local_montage_plan
+from corpus_idf import CorpusIDF, document_key
 from audio_peaks import ensure_wav, energy_peaks
-from llm_mix import mix_and_order_clips  # optional GPT mixing
+from llm_mix import mix_and_order_clips, plan_montage  # optional GPT mixing
 
 def pick_highlights(transcript: List[Dict], work_dir: str, config_path: str, video_path: str = None):
     with open(config_path, "r", encoding="utf-8") as f:
@@ -17,11 +18,29 @@ def pick_highlights(transcript: List[Dict], work_dir: str, config_path: str, vid
     window  = float(scoring.get("window_sec", 10.0))
     stride  = float(scoring.get("stride_sec", 5.0))
     mode    = (scoring.get("mode", "hybrid") or "hybrid").lower()  # local | gpt | hybrid
+    weights = scoring.get("weights") or None      # hook_mixer.WEIGHTS overrides (see sweep.py)
+    iou     = float(scoring.get("iou_thresh", 0.3))
+    boost   = float(scoring.get("peak_boost", 0.5))
 
     print("\n✨ Picking highlights (hooks + audio)…")
 
+    # channel-wide token statistics (optional)
+    corpus = None
+    try:
+        corpus = CorpusIDF.from_config(cfg)
+    except Exception as e:
+        print(f"⚠️ corpus IDF unavailable: {e}")
+    corpus_w = float(((scoring.get("corpus_idf", {}) or {}).get("weight", 0.4)))
+
     # 1) Local hook candidates
-    local_hooks = find_hooks(transcript, window_s=window, hop_s=stride, top_k=max(top_k*3, top_k))
+    local_hooks = find_hooks(transcript, window_s=window, hop_s=stride, top_k=max(top_k*3, top_k),
+                             corpus=corpus, corpus_weight=corpus_w, weights=weights, iou_thresh=iou)
+
+    # count this transcript into the corpus for future videos
+    if corpus is not None:
+        name = os.path.basename(os.path.normpath(work_dir))
+        corpus.add_document(document_key(name, transcript),
+                            (w for t in transcript for w in content_tokens(t.get("text", ""))))
     refined = refine_hook_boundaries(
         local_hooks, transcript,
         lead_pad=float(clip_cfg.get("buffer_in", 0.25)),
@@ -30,6 +49,26 @@ def pick_highlights(transcript: List[Dict], work_dir: str, config_path: str, vid
         max_refined_len_s=max_s
     )
 
+    # 1b) Optional montage output: one plan over the refined hooks (rendered by montage.py).
+    #     An earlier run's plan is dropped first, so a skipped or failed plan never renders stale hooks.
+    from montage import plan_path, save_plan
+    if os.path.isfile(plan_path(work_dir)):
+        os.remove(plan_path(work_dir))
+    mcfg = cfg.get("montage", {}) or {}
+    if mcfg.get("enabled", False) and refined:
+        try:
+            title = os.path.basename(os.path.normpath(work_dir))
+            t_len, m_clips = float(mcfg.get("target_len", 35)), int(mcfg.get("max_clips", 4))
+            if mode in ("gpt", "hybrid"):
+                plan = plan_montage(refined, title, target_len_s=t_len, max_clips=m_clips,
+                                    model=scoring.get("gpt_model", "gpt-4o-mini"))
+            else:
+                plan = local_montage_plan(refined, t_len, m_clips)
+            save_plan(work_dir, plan, refined)
+            print(f"🎞️ Montage plan: {' → '.join(plan.get('sequence', []))}")
+        except Exception as e:
+            print(f"⚠️ montage plan skipped: {e}")
+
     # 2) Filter by length
     candidates = []
     for h in refined:
@@ -50,7 +89,7 @@ def pick_highlights(transcript: List[Dict], work_dir: str, config_path: str, vid
             for c in candidates:
                 mid = 0.5*(c["start"]+c["end"])
                 if near_peak(c["start"], pts) or near_peak(mid, pts):
-                    c["score"] = c.get("score", 0.0) + 0.5
+                    c["score"] = c.get("score", 0.0) + boost
         except Exception as e:
             print(f"⚠️ audio peak step skipped: {e}")
 
@@ -1,8 +1,8 @@
 # hook_mixer.py
 # Local hook finder (cheap) + prompt builder (tiny) + sentence-boundary refinement + ffmpeg command planner
 
-from typing import List, Dict, Tuple
-import math, re
+from typing import List, Dict, Tuple, Optional
+import math, re, heapq
 from collections import Counter
 
 # --------------------------- config / lexicons ---------------------------
@@ -135,18 +135,25 @@ def make_segments(transcript: List[Dict], window_s: float = 10.0, hop_s: float =
 
 # --------------------------- rarity / tf-idf-ish ---------------------------
 
-def rarity_scores(segments: List[Dict]) -> Dict[int, float]:
+def content_tokens(text: str) -> List[str]:
+    return [w for w in tokenize(text) if w not in STOPWORDS and len(w) > 2]
+
+def segment_tokens(segments: List[Dict]) -> Dict[int, List[str]]:
+    return {s["id"]: content_tokens(s["text"]) for s in segments}
+
+def rarity_scores(segments: List[Dict], tokens: Optional[Dict[int, List[str]]] = None) -> Dict[int, float]:
+    # tokens: segment_tokens(segments), if already computed
+    tokens = tokens if tokens is not None else segment_tokens(segments)
     # document frequency over segments (unique tokens per seg)
     df = Counter()
     for s in segments:
-        toks = set(w for w in tokenize(s["text"]) if w not in STOPWORDS and len(w) > 2)
-        for w in toks:
+        for w in set(tokens[s["id"]]):
             df[w] += 1
     N = len(segments) + 1e-9
     idf = {w: math.log(N / (c + 1.0)) for w, c in df.items()}
     scores = {}
     for s in segments:
-        toks = [w for w in tokenize(s["text"]) if w not in STOPWORDS and len(w) > 2]
+        toks = tokens[s["id"]]
         if not toks:
             scores[s["id"]] = 0.0
             continue
@@ -154,45 +161,68 @@ def rarity_scores(segments: List[Dict]) -> Dict[int, float]:
         scores[s["id"]] = rar
     return scores
 
+def corpus_rarity_scores(segments: List[Dict], corpus,
+                         tokens: Optional[Dict[int, List[str]]] = None) -> Dict[int, float]:
+    """Mean corpus-wide IDF per segment (corpus: corpus_idf.CorpusIDF); one lookup per distinct token."""
+    toks_by_id = tokens if tokens is not None else segment_tokens(segments)
+    idf = corpus.idf([w for toks in toks_by_id.values() for w in toks])
+    return {sid: (sum(idf[w] for w in toks) / len(toks) if toks else 0.0)
+            for sid, toks in toks_by_id.items()}
+
 # --------------------------- hook scoring ---------------------------
 
-def score_segment(s: Dict, idf_score: float) -> float:
+# default weights; scoring.weights in config.yaml overrides any of them (tune with sweep.py)
+WEIGHTS = {
+    "idf": 1.2,
+    "question": 0.6,
+    "exclaim": 0.3,
+    "number": 0.25,
+    "list_number": 0.15,     # numbers in "top 5 / 3 mistakes" style lines
+    "curiosity": 0.25,       # per lexicon hit
+    "urgency": 0.20,
+    "superlative": 0.20,
+    "controversy": 0.30,
+    "len_ideal": 0.5,        # hooks ~6–12s
+    "len_ok": 0.2,           # 3–6s or 12–18s
+    "len_other": -0.2,
+    "density": -0.0004,      # per character beyond 350
+}
+
+def segment_features(s: Dict, idf_score: float) -> Dict[str, float]:
+    """Raw feature values of a window; score_segment is their dot product with WEIGHTS."""
     text = s["text"]
     toks = set(tokenize(text))
     length = clip_len(s["start"], s["end"])
+    numeric = bool(NUMERIC_RE.search(text))
+    return {
+        "idf": idf_score,
+        "question": 1.0 if has_question(text) else 0.0,
+        "exclaim": 1.0 if "!" in text else 0.0,
+        "number": 1.0 if numeric else 0.0,
+        "list_number": 1.0 if numeric and re.search(r"\b(top|step|reason|lesson|rule|mistake)s?\b", text.lower()) else 0.0,
+        "curiosity": float(len(CURIOSITY & toks)),
+        "urgency": float(len(URGENCY & toks)),
+        "superlative": float(len(SUPERLATIVES & toks)),
+        "controversy": float(len(CONTROVERSY & toks)),
+        "len_ideal": 1.0 if 6 <= length <= 12 else 0.0,
+        "len_ok": 1.0 if (3 <= length < 6 or 12 < length <= 18) else 0.0,
+        "len_other": 1.0 if not (3 <= length <= 18) else 0.0,
+        "density": float(max(0, len(text) - 350)),
+    }
 
-    q_bonus = 0.6 if has_question(text) else 0.0
-    exclam = 0.3 if "!" in text else 0.0
-
-    num_bonus = 0.0
-    if NUMERIC_RE.search(text):
-        num_bonus += 0.25
-        if re.search(r"\b(top|step|reason|lesson|rule|mistake)s?\b", text.lower()):
-            num_bonus += 0.15
-
-    curi = len(CURIOSITY & toks) * 0.25
-    urg  = len(URGENCY   & toks) * 0.20
-    sup  = len(SUPERLATIVES & toks) * 0.20
-    ctr  = len(CONTROVERSY & toks) * 0.30
-
-    # length preference: hooks ~6–12s
-    if 6 <= length <= 12:
-        length_pref = 0.5
-    elif 3 <= length < 6 or 12 < length <= 18:
-        length_pref = 0.2
-    else:
-        length_pref = -0.2
-
-    char_len = len(text)
-    density = -0.0004 * max(0, char_len - 350)
-
-    score = (
-        1.2 * idf_score
-        + q_bonus + exclam + num_bonus
-        + curi + urg + sup + ctr
-        + length_pref + density
-    )
-    return round(score, 4)
+def score_segment(s: Dict, idf_score: float,
+                  corpus_score: Optional[float] = None, corpus_weight: float = 0.0,
+                  weights: Optional[Dict[str, float]] = None) -> float:
+    """
+    corpus_score: channel-wide rarity of the same tokens; blended into the per-video
+    IDF so recurring catchphrases stop looking rare.
+    weights: overrides for WEIGHTS.
+    """
+    if corpus_score is not None and corpus_weight > 0:
+        idf_score = (1.0 - corpus_weight) * idf_score + corpus_weight * corpus_score
+    w = dict(WEIGHTS, **weights) if weights else WEIGHTS
+    f = segment_features(s, idf_score)
+    return round(sum(w[k] * v for k, v in f.items()), 4)
 
 # --------------------------- non-overlapping picker ---------------------------
 
@@ -220,15 +250,143 @@ def pick_top_nonoverlapping(segments: List[Dict], scores: Dict[int, float],
 def find_hooks(transcript: List[Dict],
                window_s: float = 10.0,
                hop_s: float = 5.0,
-               top_k: int = 5) -> List[Dict]:
+               top_k: int = 5,
+               corpus=None,
+               corpus_weight: float = 0.4,
+               weights: Optional[Dict[str, float]] = None,
+               iou_thresh: float = 0.3) -> List[Dict]:
     segments = make_segments(transcript, window_s, hop_s)
-    rar = rarity_scores(segments)
-    scored = {s["id"]: score_segment(s, rar.get(s["id"], 0.0)) for s in segments}
-    top = pick_top_nonoverlapping(segments, scored, top_k=top_k)
+    toks = segment_tokens(segments)
+    rar = rarity_scores(segments, toks)
+    crar, cw = {}, 0.0
+    if corpus is not None:
+        crar, cw = corpus_rarity_scores(segments, corpus, toks), corpus.weight(corpus_weight)
+    scored = {s["id"]: score_segment(s, rar.get(s["id"], 0.0), crar.get(s["id"]), cw, weights) for s in segments}
+    top = pick_top_nonoverlapping(segments, scored, top_k=top_k, iou_thresh=iou_thresh)
     for i, t in enumerate(top):
         t["hook_id"] = f"H{i+1}"
     return top
 
+# --------------------------- incremental (live / growing recordings) ---------------------------
+
+class IncrementalHookScorer:
+    """
+    find_hooks for a transcript that keeps growing. Items are appended as they are
+    committed; rolling windows (same geometry as make_segments) are scored once they
+    can no longer change, document frequencies are updated in place, and a bounded
+    min-heap keeps the best candidates. top() re-scores only the heap against the
+    current IDF, since rarity drifts as the corpus of windows grows. Published ranges
+    are passed to exclude() (and rejected windows to discard()), so they leave the pool
+    instead of holding top_k slots for the rest of the stream.
+    """
+    def __init__(self, window_s: float = 10.0, hop_s: float = 5.0,
+                 top_k: int = 5, pool: int = 0, iou_thresh: float = 0.3,
+                 corpus=None, corpus_weight: float = 0.4,
+                 weights: Optional[Dict[str, float]] = None):
+        self.window_s = float(window_s)
+        self.hop_s = float(hop_s)
+        self.top_k = int(top_k)
+        self.pool = int(pool) or max(50, 10 * self.top_k)
+        self.iou_thresh = float(iou_thresh)
+        self.corpus = corpus
+        self.corpus_weight = corpus.weight(corpus_weight) if corpus is not None else 0.0
+        self.weights = weights
+        self._corpus_idf: Dict[str, float] = {}
+        self.items: List[Dict] = []
+        self.df = Counter()
+        self.segments: Dict[int, Dict] = {}
+        self._tokens: Dict[int, List[str]] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._excluded: List[Tuple[float, float]] = []
+        self._next_start = None
+        self._first = 0          # first item that can still touch an open window
+
+    def _idf(self, w: str) -> float:
+        return math.log((len(self.segments) + 1e-9) / (self.df.get(w, 0) + 1.0))
+
+    def _rarity(self, sid: int) -> float:
+        toks = self._tokens[sid]
+        return sum(self._idf(w) for w in toks) / len(toks) if toks else 0.0
+
+    def _corpus_rarity(self, sid: int) -> Optional[float]:
+        if self.corpus is None:
+            return None
+        toks = self._tokens[sid]
+        missing = [w for w in toks if w not in self._corpus_idf]
+        if missing:
+            self._corpus_idf.update(self.corpus.idf(missing))
+        return sum(self._corpus_idf[w] for w in toks) / len(toks) if toks else 0.0
+
+    def _score(self, seg: Dict) -> float:
+        sid = seg["id"]
+        return score_segment(seg, self._rarity(sid), self._corpus_rarity(sid), self.corpus_weight, self.weights)
+
+    def add(self, items: List[Dict]) -> int:
+        """Append committed transcript items (in time order). Returns #windows finalized."""
+        self.items.extend(items)
+        if not self.items:
+            return 0
+        if self._next_start is None:
+            self._next_start = float(self.items[0]["start"])
+        last_start = float(self.items[-1]["start"])
+        n = 0
+        # a window is final once some committed item starts after its end
+        while self._next_start + self.window_s < last_start:
+            ws, we = self._next_start, self._next_start + self.window_s
+            while self._first < len(self.items) and float(self.items[self._first]["end"]) < ws:
+                self._first += 1
+            texts = []
+            j = self._first
+            while j < len(self.items) and float(self.items[j]["start"]) <= we:
+                texts.append(self.items[j]["text"])
+                j += 1
+            text = " ".join(texts).strip()
+            if text:
+                sid = len(self.segments)
+                seg = {"id": sid, "start": ws, "end": we, "text": text}
+                toks = content_tokens(text)
+                self.segments[sid] = seg
+                self._tokens[sid] = toks
+                for w in set(toks):
+                    self.df[w] += 1
+                sc = self._score(seg)
+                if self._blocked(seg):
+                    pass   # still counted for IDF, never a candidate
+                elif len(self._heap) < self.pool:
+                    heapq.heappush(self._heap, (sc, sid))
+                elif sc > self._heap[0][0]:
+                    heapq.heapreplace(self._heap, (sc, sid))
+                n += 1
+            self._next_start += self.hop_s
+        return n
+
+    def _blocked(self, seg: Dict) -> bool:
+        return any(min(seg["end"], b) - max(seg["start"], a) > 0 for a, b in self._excluded)
+
+    def _filter(self, keep):
+        self._heap = [(sc, sid) for sc, sid in self._heap if keep(sid)]
+        heapq.heapify(self._heap)
+
+    def exclude(self, start: float, end: float):
+        """Drop windows overlapping [start, end] (e.g. a published clip), now and later."""
+        self._excluded.append((float(start), float(end)))
+        self._filter(lambda sid: not self._blocked(self.segments[sid]))
+
+    def discard(self, sid: int):
+        """Drop one candidate window for good (e.g. it can never be published)."""
+        self._filter(lambda x: x != sid)
+
+    def top(self, k: int = 0) -> List[Dict]:
+        cands = [self.segments[sid] for _, sid in self._heap]
+        scores = {s["id"]: self._score(s) for s in cands}
+        # refresh heap keys with the current IDF
+        self._heap = [(scores[s["id"]], s["id"]) for s in cands]
+        heapq.heapify(self._heap)
+        top = pick_top_nonoverlapping(cands, scores, top_k=k or self.top_k, iou_thresh=self.iou_thresh)
+        for t in top:
+            t["hook_id"] = f"W{t['id']}"
+        return top
+
 # --------------------------- refine to sentence boundaries ---------------------------
 
 def _find_containing_sentence(hook: Dict, sentences: List[Dict]) -> int:
@@ -307,6 +465,44 @@ def build_mix_prompt(video_title: str,
 
 # --------------------------- ffmpeg command planner ---------------------------
 
+def plan_parts(plan: Dict, hooks_by_id: Dict[str, Dict]) -> List[Tuple[float, float]]:
+    """
+    Source-time (start, end) ranges of a plan, in playback order: hooks follow
+    plan["sequence"] (clip_ranges order if there is none); each hook plays its "use"
+    sub-ranges (offsets into the hook, clamped to it), or the whole hook if it has none.
+    """
+    uses: Dict[str, List] = {}
+    for entry in plan.get("clip_ranges", []) or []:
+        if isinstance(entry, dict) and entry.get("hook_id") in hooks_by_id:
+            uses.setdefault(entry["hook_id"], []).extend(entry.get("use") or [])
+    order = [h for h in (plan.get("sequence") or []) if h in hooks_by_id] or list(uses)
+    parts = []
+    for hid in order:
+        base = hooks_by_id[hid]
+        hs, he = float(base["start"]), float(base["end"])
+        for rng in uses.get(hid) or [[0.0, he - hs]]:
+            try:
+                a, b = float(rng[0]), float(rng[1])
+            except (TypeError, ValueError, IndexError):
+                continue
+            a, b = hs + max(0.0, a), min(he, hs + b)
+            if b - a > 0.2:
+                parts.append((round(a, 3), round(b, 3)))
+    return parts
+
+def local_montage_plan(hooks: List[Dict], target_len_s: float = 35.0, max_clips: int = 4) -> Dict:
+    """Plan without a model: strongest hooks first until the target length is filled."""
+    seq, total = [], 0.0
+    for h in sorted(hooks, key=lambda x: x.get("score", 0.0), reverse=True):
+        if len(seq) >= max_clips:
+            break
+        d = float(h["end"]) - float(h["start"])
+        if seq and total + d > target_len_s:
+            continue
+        seq.append(h["hook_id"])
+        total += d
+    return {"sequence": seq, "clip_ranges": [], "notes": "local: top hooks by score"}
+
 def ffmpeg_commands_from_plan(src_path: str,
                               plan: Dict,
                               hooks_by_id: Dict[str, Dict],
@@ -316,24 +512,17 @@ def ffmpeg_commands_from_plan(src_path: str,
             "clip_ranges":[{"hook_id":"H1","use":[[0.0,6.2], ...]}, ...]}
     hooks_by_id: map hook_id -> hook dict
     Returns a list of shell commands: one per clip + final concat command.
+    (For display; montage.render_montage executes a plan.)
     """
     cmds = []
     parts = []
-    idx = 1
-    for entry in plan.get("clip_ranges", []):
-        hid = entry["hook_id"]
-        if hid not in hooks_by_id:
-            continue
-        base = hooks_by_id[hid]
-        for rng in entry.get("use", []):
-            start = base["start"] + float(rng[0])
-            dur = float(rng[1]) - float(rng[0])
-            out = f"part_{idx:02d}.mp4"
-            # Copy codecs for zero-reencode; switch to -c:v libx264 -c:a aac if you need re-encode
-            cmd = f'ffmpeg -y -ss {start:.3f} -i "{src_path}" -t {dur:.3f} -c copy "{out}"'
-            cmds.append(cmd)
-            parts.append(out)
-            idx += 1
+    for idx, (start, end) in enumerate(plan_parts(plan, hooks_by_id), start=1):
+        dur = end - start
+        out = f"part_{idx:02d}.mp4"
+        # Copy codecs for zero-reencode; switch to -c:v libx264 -c:a aac if you need re-encode
+        cmd = f'ffmpeg -y -ss {start:.3f} -i "{src_path}" -t {dur:.3f} -c copy "{out}"'
+        cmds.append(cmd)
+        parts.append(out)
     # concat list file
     concat_txt = "concat.txt"
     cmds.append(f'printf "" > {concat_txt}')  # ensure file exists (POSIX); on Windows, create manually
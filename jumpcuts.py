@@ -0,0 +1,189 @@
+# jumpcuts.py
+# Dead-air removal inside a clip, applied in the clip's own encode (no extra pass):
+# keep-intervals from transcript gaps + the cached RMS envelope -> select/aselect with
+# timestamps shifted by the time removed so far, and captions retimed through the same map.
+# Keep-maps are stored per clip in clips/clip_NNN.keep.json for the caption pass.
+
+import os, json
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+from audio_peaks import ensure_wav, rms_envelope
+
+Interval = Tuple[float, float]
+
+def _opts(cfg: Dict) -> Dict:
+    j = cfg.get("jumpcuts", {}) or {}
+    return {
+        "enabled": bool(j.get("enabled", False)),
+        "min_gap": float(j.get("min_gap", 0.6)),            # pauses at least this long are cut
+        "keep_pad": float(j.get("keep_pad", 0.12)),         # breathing room left around speech
+        "min_cut": float(j.get("min_cut", 0.3)),            # don't bother with shorter cuts
+        "min_keep": float(j.get("min_keep", 0.3)),          # fragments between cuts shorter than this go too
+        "silence_db": float(j.get("silence_db", 28.0)),     # quiet = this far below the clip's speech level
+        "gap_db": float(j.get("gap_db", 12.0)),             # transcript gaps must be at least this quiet
+        "max_cuts": int(j.get("max_cuts", 12)),
+        "min_saving": float(j.get("min_saving", 0.5)),      # skip clips that would lose less than this
+    }
+
+def enabled(cfg: Dict) -> bool:
+    return _opts(cfg)["enabled"]
+
+@lru_cache(maxsize=8)
+def _speech(path: str, mtime: float) -> Tuple[Tuple[float, float], ...]:
+    with open(path, "r", encoding="utf-8") as f:
+        return tuple((float(t["start"]), float(t["end"])) for t in json.load(f) if (t.get("text") or "").strip())
+
+@lru_cache(maxsize=8)
+def _envelope(path: str, mtime: float) -> Tuple[np.ndarray, np.ndarray, float]:
+    times, rms = rms_envelope(path)
+    hop = float(times[1] - times[0]) if len(times) > 1 else 0.125
+    return np.asarray(times, np.float64), 20.0 * np.log10(np.asarray(rms, np.float64) + 1e-9), hop
+
+def _runs(mask: np.ndarray, t: np.ndarray, hop: float) -> List[Interval]:
+    out, i, n = [], 0, len(mask)
+    while i < n:
+        if mask[i]:
+            j = i
+            while j + 1 < n and mask[j + 1]:
+                j += 1
+            out.append((float(t[i]) - hop / 2, float(t[j]) + hop / 2))
+            i = j + 1
+        else:
+            i += 1
+    return out
+
+def _merge(iv: List[Interval], join: float = 0.0) -> List[Interval]:
+    out = []
+    for a, b in sorted(iv):
+        if out and a <= out[-1][1] + join:
+            out[-1] = (out[-1][0], max(out[-1][1], b))
+        else:
+            out.append((a, b))
+    return out
+
+def keep_intervals(video_path: str, start: float, end: float, work_dir: str, cfg: Dict) -> Optional[List[Interval]]:
+    """
+    Clip-relative [(a, b), ...] to keep for the source range [start, end], or None when
+    nothing worth cutting (or no transcript/audio to decide from).
+    """
+    o = _opts(cfg)
+    dur = end - start
+    tr_path = os.path.join(work_dir, "transcript.json")
+    if not os.path.isfile(tr_path):
+        return None
+    wav = ensure_wav(video_path, os.path.join(work_dir, "audio16k.wav"), sr=16000)
+    t, db, hop = _envelope(wav, os.path.getmtime(wav))
+    sel = (t >= start) & (t <= end)
+    if sel.sum() < 4:
+        return None
+    rel, cdb = t[sel] - start, db[sel]
+    ref = float(np.percentile(cdb, 90))   # the clip's speech level
+
+    # 1) stretches quiet enough to be dead air no matter what the transcript says
+    cuts = [iv for iv in _runs(cdb < ref - o["silence_db"], rel, hop) if iv[1] - iv[0] >= o["min_gap"]]
+
+    # 2) gaps between transcript segments that are also reasonably quiet
+    speech = [(max(0.0, s - start), min(dur, e - start)) for s, e in _speech(tr_path, os.path.getmtime(tr_path))
+              if e > start and s < end]
+    prev = 0.0
+    for a, b in _merge(speech) + [(dur, dur)]:
+        if a - prev >= o["min_gap"]:
+            m = (rel >= prev) & (rel <= a)
+            if not m.any() or float(np.median(cdb[m])) < ref - o["gap_db"]:
+                cuts.append((prev, a))
+        prev = max(prev, b)
+
+    # 3) leave padding around speech (not at the clip edges), drop slivers
+    padded = []
+    for a, b in _merge(cuts):
+        a = 0.0 if a <= hop else a + o["keep_pad"]
+        b = dur if b >= dur - hop else b - o["keep_pad"]
+        if b - a >= o["min_cut"]:
+            padded.append((max(0.0, a), min(dur, b)))
+    cuts = _merge(padded, join=o["min_keep"])
+    if len(cuts) > o["max_cuts"]:
+        cuts = sorted(sorted(cuts, key=lambda c: c[0] - c[1])[:o["max_cuts"]])
+    if sum(b - a for a, b in cuts) < o["min_saving"]:
+        return None
+
+    keeps, prev = [], 0.0
+    for a, b in cuts:
+        if a > prev:
+            keeps.append((round(prev, 3), round(a, 3)))
+        prev = b
+    if prev < dur:
+        keeps.append((round(prev, 3), round(dur, 3)))
+    return keeps or None
+
+# --------------------------- filters ---------------------------
+
+def _select(keeps: List[Interval]) -> str:
+    return "+".join(f"between(t,{a:.3f},{b:.3f})" for a, b in keeps)
+
+def _removed_before(keeps: List[Interval], var: str = "T") -> str:
+    """Seconds cut before time `var`, as a step function over the keep starts."""
+    terms, prev = [], 0.0
+    for a, b in keeps:
+        if a - prev > 0:
+            terms.append(f"gte({var},{a:.3f})*{a - prev:.3f}")
+        prev = b
+    return "+".join(terms) or "0"
+
+# Frames arrive in clip time (input-side -ss); the step function already counts a leading cut,
+# so subtracting STARTPTS as well would shift everything after it by that cut a second time.
+
+def video_filter(keeps: List[Interval]) -> str:
+    """Append after the fit/crop chain (crop paths use source clip time) and before subtitles."""
+    return f"select='{_select(keeps)}',setpts='PTS-({_removed_before(keeps)})/TB'"
+
+def audio_filter(keeps: List[Interval]) -> str:
+    """Prepend to the gain chain; aresample closes the sub-frame seams aselect leaves."""
+    return (f"aselect='{_select(keeps)}',asetpts='PTS-({_removed_before(keeps)})/TB',"
+            f"aresample=async=1:first_pts=0")
+
+def kept_duration(keeps: List[Interval]) -> float:
+    return sum(b - a for a, b in keeps)
+
+# --------------------------- caption retiming ---------------------------
+
+def retime(x: float, keeps: List[Interval]) -> float:
+    """Map clip-relative time to the cut timeline; times inside a cut snap to the next keep."""
+    out = 0.0
+    for a, b in keeps:
+        if x < a:
+            return out
+        if x <= b:
+            return out + (x - a)
+        out += b - a
+    return out
+
+def retime_lines(lines: List[Dict], keeps: List[Interval], min_len: float = 0.05) -> List[Dict]:
+    out = []
+    for ln in lines:
+        s, e = retime(ln["start"], keeps), retime(ln["end"], keeps)
+        if e - s >= min_len:
+            out.append(dict(ln, start=s, end=e))
+    return out
+
+def keep_path(work_dir: str, i: int, sub: str = "clips") -> str:
+    return os.path.join(work_dir, sub, f"clip_{i:03}.keep.json")
+
+def save_keeps(work_dir: str, i: int, start: float, end: float, keeps: Optional[List[Interval]],
+               sub: str = "clips"):
+    """Record (or clear) the keep-map of clip i for the caption pass (sub: output folder)."""
+    path = keep_path(work_dir, i, sub)
+    if not keeps:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"start": start, "end": end, "keep": keeps}, f)
+
+def load_keeps(work_dir: str, i: int) -> Optional[Dict]:
+    try:
+        with open(keep_path(work_dir, i), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
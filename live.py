@@ -0,0 +1,173 @@
+# live.py
+# Tail mode for growing recordings (MPEG-TS / MKV / FLV; a plain MP4 is unreadable until its
+# moov is written). Audio is pulled in overlapping chunks, transcribed with one resident Whisper
+# model, and committed to <work_dir>/transcript.jsonl (+ transcript.json/.srt for captions).
+#
+#   python live.py simulate input/stream.mp4 input/live.ts --speed 4   # fake a growing file
+#   python pipeline.py --tail input/live.ts
+
+import os, json, time, argparse
+from typing import Dict, List, Optional
+
+import procman
+import resources
+from transcriber_torch import load_model, transcribe_chunk, write_transcript
+
+class LiveTranscriber:
+    def __init__(self, src: str, work_dir: str, config_path: str, cfg: Dict):
+        live = cfg.get("live", {}) or {}
+        self.src = src
+        self.work_dir = work_dir
+        self.config_path = config_path
+        self.chunk_sec = float(live.get("chunk_sec", 60))
+        self.overlap_sec = float(live.get("overlap_sec", 5))
+        self.idle_sec = float(live.get("idle_sec", 60))
+        self.poll_sec = float(live.get("poll_sec", 5))
+        self.model = None
+        self._resident = None   # memory-only reservation for the loaded model
+        self.store = os.path.join(work_dir, "transcript.jsonl")
+        self.transcript: List[Dict] = []
+        os.makedirs(work_dir, exist_ok=True)
+        if os.path.isfile(self.store):
+            # resume after a restart
+            with open(self.store, "r", encoding="utf-8") as f:
+                self.transcript = [json.loads(l) for l in f if l.strip()]
+        self.committed = float(self.transcript[-1]["end"]) if self.transcript else 0.0
+        self.drained = False   # set by a final step that found no audio left to transcribe
+        self._last_size = -1
+        self._last_growth = time.time()
+
+    def _growing(self) -> bool:
+        try:
+            size = os.path.getsize(self.src)
+        except OSError:
+            size = -1
+        if size != self._last_size:
+            self._last_size = size
+            self._last_growth = time.time()
+        return time.time() - self._last_growth < self.idle_sec
+
+    def _extract(self, start: float, length: float) -> (str, float):
+        wav = os.path.join(self.work_dir, "live_chunk.wav")
+        procman.run([
+            "ffmpeg","-y","-ss", f"{start:.3f}", "-t", f"{length:.3f}", "-i", self.src,
+            "-vn","-ac","1","-ar","16000","-c:a","pcm_s16le", wav
+        ], duration=length, timeout_factor=1.0)
+        secs = max(0.0, (os.path.getsize(wav) - 44) / 32000.0)   # 16 kHz mono s16
+        return wav, secs
+
+    def _commit(self, items: List[Dict]):
+        self.transcript.extend(items)
+        with open(self.store, "a", encoding="utf-8") as f:
+            for it in items:
+                f.write(json.dumps(it, ensure_ascii=False) + "\n")
+        write_transcript(self.transcript, self.work_dir)
+
+    def step(self, final: bool = False) -> Optional[List[Dict]]:
+        """
+        Transcribe the next chunk. Returns newly committed items, or None when not enough
+        new audio exists yet (final: none is left, and self.drained is set). The last
+        overlap_sec of a chunk is only context: items ending there are re-transcribed with
+        the next chunk, which starts overlap_sec early.
+        """
+        self.drained = False
+        start = max(0.0, self.committed - self.overlap_sec)
+        try:
+            length = self.chunk_sec + 2 * self.overlap_sec
+            wav, secs = self._extract(start, length)
+        except Exception as e:
+            print(f"⚠️ live: audio extract failed ({e}); retrying")
+            return None
+        new_audio = start + secs - self.committed
+        if not final and new_audio < self.chunk_sec:
+            return None
+        if final and new_audio <= 0.5:
+            self.drained = True
+            return None
+        prompt = " ".join(t["text"] for t in self.transcript[-6:])[-200:]
+        # the resident model's memory stays reserved until follow() returns; the cores are taken
+        # per chunk, so the encodes of published clips and the next _extract get in between.
+        # Neither is measured: a warm chunk says little about what a full Whisper run needs.
+        rm = resources.manager()
+        if self._resident is None:
+            self._resident = rm.reserve("whisper")
+        ticket = rm.acquire("whisper", mem=False)
+        try:
+            if self.model is None:
+                self.model = load_model(self.config_path)
+            segs = transcribe_chunk(self.model, wav, offset=start, prompt=prompt)
+        finally:
+            rm.release(ticket)
+        # a final chunk that still hit the length limit is backlog, not the end of the audio
+        last = final and secs < length - 0.5
+        cutoff = start + secs - (0.0 if last else self.overlap_sec)
+        if not last:
+            # speech crossing the cutoff is committed with the next chunk: stop before it, since
+            # anything starting before `committed` is dropped from then on
+            cross = [s["start"] for s in segs if self.committed - 0.05 <= s["start"] < cutoff < s["end"]]
+            if cross and cross[0] > self.committed + 0.5:
+                cutoff = cross[0]
+        keep = [s for s in segs if s["start"] >= self.committed - 0.05 and s["end"] <= cutoff and s["text"]]
+        self._commit(keep)
+        until = cutoff if not keep or last else keep[-1]["end"]
+        self.committed = max(self.committed, until)
+        print(f"  • live: committed {len(keep)} segment(s) up to {self.committed:.1f}s")
+        return keep
+
+    def follow(self, on_items):
+        """
+        Poll until the source stops growing for idle_sec and all of its audio is transcribed
+        (the backlog is worked off chunk by chunk); on_items(items, committed_until).
+        """
+        print(f"\n📡 Following {self.src} (chunk {self.chunk_sec:.0f}s, overlap {self.overlap_sec:.0f}s)…")
+        try:
+            while True:
+                growing = self._growing()
+                items = self.step(final=not growing)
+                if items is None:
+                    if not growing and self.drained:
+                        print("⏹️ Source stopped growing; tail finished.")
+                        return
+                    time.sleep(self.poll_sec)
+                    continue
+                on_items(items, self.committed)
+        finally:
+            self.model = None
+            if self._resident is not None:
+                resources.manager().release(self._resident)
+                self._resident = None
+
+# --------------------------- local simulation ---------------------------
+
+def simulate_growing(src: str, dst: str, speed: float = 1.0, step_sec: float = 1.0):
+    """Write src into dst as MPEG-TS at `speed` x real time, to exercise --tail locally."""
+    from reel import probe_params
+    full = src
+    if not src.lower().endswith(".ts"):
+        full = dst + ".full.ts"
+        procman.run(["ffmpeg","-y","-i", src, "-c","copy","-f","mpegts", full])
+    dur = probe_params(full)["duration"] or 1.0
+    rate = os.path.getsize(full) / dur * speed
+    print(f"📼 Simulating a {dur:.0f}s recording at {speed:g}x into {dst}")
+    with open(full, "rb") as fi, open(dst, "wb") as fo:
+        while True:
+            chunk = fi.read(max(1, int(rate * step_sec)))
+            if not chunk:
+                break
+            fo.write(chunk)
+            fo.flush()
+            time.sleep(step_sec)
+    if full != src:
+        os.remove(full)
+    print("📼 Simulation finished.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sim = sub.add_parser("simulate", help="Grow a .ts file from an existing recording")
+    sim.add_argument("src")
+    sim.add_argument("dst")
+    sim.add_argument("--speed", type=float, default=1.0)
+    args = parser.parse_args()
+    if args.cmd == "simulate":
+        simulate_growing(args.src, args.dst, speed=args.speed)
@@ -56,3 +56,45 @@ def mix_and_order_clips(candidates: List[Dict], transcript: List[Dict], top_k: i
         print(f"⚠️ OpenAI error: {e}")
 
     return candidates[:top_k]
+
+def plan_montage(hooks: List[Dict], video_title: str, target_len_s: int = 35, max_clips: int = 4,
+                 model: str = "gpt-4o-mini") -> Dict:
+    """
+    Montage plan ({sequence, clip_ranges, notes}) for hook_mixer.plan_parts, from the
+    build_mix_prompt format; falls back to the local top-hooks plan.
+    """
+    from hook_mixer import build_mix_prompt, local_montage_plan
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        print("⚠️ No OPENAI_API_KEY; using the local montage plan.")
+        return local_montage_plan(hooks, target_len_s, max_clips)
+
+    client = OpenAI(api_key=api_key)
+    ids = {h["hook_id"] for h in hooks}
+    try:
+        resp = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role":"system","content":"Return only JSON, no commentary."},
+                {"role":"user","content":build_mix_prompt(video_title, hooks, target_len_s, max_clips)}
+            ],
+            temperature=0.2,
+            max_tokens=500
+        )
+        txt = resp.choices[0].message.content.strip()
+        if txt.startswith("```"):
+            txt = txt.strip("`")
+            nl = txt.find("\n")
+            if nl != -1 and txt[:nl].lower().startswith("json"):
+                txt = txt[nl+1:]
+        plan = json.loads(txt)
+        seq = [h for h in (plan.get("sequence") or []) if h in ids][:max_clips]
+        if seq:
+            plan["sequence"] = seq
+            plan["clip_ranges"] = [c for c in (plan.get("clip_ranges") or [])
+                                   if isinstance(c, dict) and c.get("hook_id") in ids]
+            return plan
+    except Exception as e:
+        print(f"⚠️ OpenAI error: {e}")
+
+    return local_montage_plan(hooks, target_len_s, max_clips)
@@ -0,0 +1,98 @@
+# loudness.py
+# One EBU R128 pass over the whole source audio (cached), then per-clip integrated loudness
+# from the momentary-loudness timeline -> a static gain + light limiter for each clip.
+# Replaces per-clip single-pass loudnorm (192 kHz upsampling, pumping on short clips,
+# clip-to-clip level drift).
+
+import os, re, json, math, subprocess, threading
+import procman
+from typing import Dict, Optional
+
+_LOCK = threading.Lock()
+_LINE = re.compile(rb"t:\s*([0-9.]+)\s+TARGET:.*?M:\s*(-?[0-9.]+|-inf)")
+
+STEP = 0.1    # ebur128 framelog interval (s); M is a 400 ms block ending at t
+BLOCK = 0.4
+
+def _opts(cfg: Dict) -> Dict:
+    l = cfg.get("loudness", {}) or {}
+    return {
+        "mode": (l.get("mode") or "static").lower(),     # static | loudnorm
+        "target_i": float(l.get("target_i", -16.0)),
+        "true_peak": float(l.get("true_peak", -1.5)),
+        "max_gain_db": float(l.get("max_gain_db", 20.0)),
+    }
+
+def static_enabled(cfg: Dict) -> bool:
+    return _opts(cfg)["mode"] == "static"
+
+def loudnorm_filter(cfg: Dict) -> str:
+    o = _opts(cfg)
+    return f"loudnorm=I={o['target_i']:g}:TP={o['true_peak']:g}:LRA=11"
+
+def measure(video_path: str, work_dir: str) -> Dict:
+    """
+    Momentary loudness timeline of the first audio stream, cached in
+    <work_dir>/loudness.json as {"t0", "step", "m": [LUFS or null, ...]}.
+    """
+    cache = os.path.join(work_dir, "loudness.json")
+    with _LOCK:
+        if os.path.isfile(cache):
+            with open(cache, "r", encoding="utf-8") as f:
+                return json.load(f)
+        print("\n🔊 Measuring source loudness (EBU R128)…")
+        # audio-only decode runs far faster than real time; no known duration -> default timeout
+        p = procman.run([
+            "ffmpeg","-hide_banner","-nostats","-i", video_path,
+            "-map","0:a:0","-af","ebur128=framelog=info",   # per-frame lines at the default log level
+            "-f","null","-"
+        ], capture_stdout=True, capture_stderr=True)
+        ts, ms = [], []
+        for m in _LINE.finditer(p.stderr):
+            ts.append(float(m.group(1)))
+            v = m.group(2)
+            ms.append(None if v == b"-inf" else round(float(v), 1))
+        if not ms:
+            # the audio stream decoded, so an empty timeline is a parse problem: don't cache it
+            raise RuntimeError("ebur128 produced no momentary loudness frames")
+        data = {"t0": ts[0] if ts else STEP, "step": STEP, "m": ms}
+        tmp = cache + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, cache)
+        return data
+
+def integrated(data: Dict, start: float, end: float) -> Optional[float]:
+    """BS.1770 gated integrated loudness over [start, end] from cached momentary blocks."""
+    t0, step, ms = float(data["t0"]), float(data["step"]), data["m"]
+    i0 = max(0, int(math.ceil((start + BLOCK - t0) / step - 1e-6)))
+    i1 = min(len(ms), int(math.floor((end - t0) / step + 1e-6)) + 1)
+    blocks = [v for v in ms[i0:i1] if v is not None and v > -70.0]   # absolute gate
+    if not blocks:
+        return None
+    z = [10 ** ((v + 0.691) / 10.0) for v in blocks]
+    rel = -0.691 + 10 * math.log10(sum(z) / len(z)) - 10.0           # relative gate
+    kept = [zi for zi, v in zip(z, blocks) if v > rel]
+    if not kept:
+        return None
+    return -0.691 + 10 * math.log10(sum(kept) / len(kept))
+
+def clip_filter(video_path: str, start: float, end: float, work_dir: str, cfg: Dict) -> str:
+    """
+    Audio filter for one clip: static gain to the target plus a sample-peak limiter at the
+    true-peak ceiling. Falls back to loudnorm if the source can't be measured.
+    """
+    o = _opts(cfg)
+    if o["mode"] == "loudnorm":
+        return loudnorm_filter(cfg)
+    try:
+        data = measure(video_path, work_dir)
+    except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+        print(f"⚠️ loudness measurement failed ({e}); using loudnorm")
+        return loudnorm_filter(cfg)
+    lufs = integrated(data, start, end)
+    if lufs is None:
+        return "anull"   # silent range; nothing to normalize
+    gain = max(-o["max_gain_db"], min(o["max_gain_db"], o["target_i"] - lufs))
+    limit = 10 ** (o["true_peak"] / 20.0)
+    return f"volume={gain:.2f}dB,alimiter=limit={limit:.4f}:attack=5:release=50:level=false"
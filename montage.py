@@ -0,0 +1,160 @@
+# montage.py
+# Executes a montage plan (hook_mixer.build_mix_prompt format, saved by pick_highlights as
+# <work_dir>/montage_plan.json) into <work_dir>/montage.mp4:
+#
+#   - parts whose source ranges lie close together are cut by one ffmpeg that decodes the
+#     span once and fans out with split/asplit + trim/atrim (frame accurate) into several parts
+#   - those groups encode in parallel (procman / resource budget) into a temp workspace
+#   - identical encode settings for every part, so the montage is one concat with -c copy
+
+import os, json, shutil, tempfile, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import procman
+import loudness
+from clipper import _fit_filter, _reframe_crop, _reframe_enabled, _video_args, renditions
+from captions_and_style import caption_style, subtitles_filter, write_clip_srt
+from hook_mixer import plan_parts
+
+_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="montage")
+
+def _opts(cfg: Dict) -> Dict:
+    m = cfg.get("montage", {}) or {}
+    return {
+        "enabled": bool(m.get("enabled", False)),
+        "target_len": float(m.get("target_len", 35)),
+        "max_clips": int(m.get("max_clips", 4)),
+        "share_gap": float(m.get("share_gap", 8.0)),     # parts this close share one decode
+        "max_span": float(m.get("max_span", 90.0)),      # ...as long as the shared span stays short
+        "captions": bool(m.get("captions", True)),
+    }
+
+def plan_path(work_dir: str) -> str:
+    return os.path.join(work_dir, "montage_plan.json")
+
+def save_plan(work_dir: str, plan: Dict, hooks: List[Dict]):
+    """Store the plan with the hook ranges it refers to, so it can run without the transcript."""
+    data = {"plan": plan,
+            "hooks": {h["hook_id"]: {"start": float(h["start"]), "end": float(h["end"])} for h in hooks}}
+    with open(plan_path(work_dir), "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+def group_parts(parts: List[Tuple[float, float]], share_gap: float, max_span: float) -> List[List[int]]:
+    """Indices of parts grouped by source proximity (each group is decoded once)."""
+    order = sorted(range(len(parts)), key=lambda k: parts[k][0])
+    groups, g_start, g_end = [], 0.0, 0.0
+    for k in order:
+        a, b = parts[k]
+        if groups and a - g_end <= share_gap and max(b, g_end) - g_start <= max_span:
+            groups[-1].append(k)
+            g_end = max(g_end, b)
+        else:
+            groups.append([k])
+            g_start, g_end = a, b
+    return groups
+
+def _geometry(cfg: Dict) -> Dict:
+    enc = cfg.get("encode", {}) or {}
+    rs = renditions(enc)
+    if rs:
+        return dict(rs[0])
+    codec = "x264" if (enc.get("mode") or "nvenc").lower() in ("x264", "copy") else "nvenc"
+    return {"width": int(enc.get("width", 1080)), "height": int(enc.get("height", 1920)),
+            "fps": int(enc.get("fps", 60)), "codec": codec}
+
+def _group_cmd(video_path: str, parts: List[Tuple[float, float]], idx: List[int], outs: List[str],
+               work_dir: str, ws: str, cfg: Dict, codec: str) -> Tuple[List[str], float]:
+    enc = cfg.get("encode", {}) or {}
+    o = _opts(cfg)
+    r = _geometry(cfg)
+    fit = r.get("fit") or ("reframe" if _reframe_enabled(cfg) else "pad")
+    gs = min(parts[k][0] for k in idx)
+    ge = max(parts[k][1] for k in idx)
+    n = len(idx)
+
+    graph = [f"[0:v]split={n}" + "".join(f"[s{j}]" for j in range(n)),
+             f"[0:a]asplit={n}" + "".join(f"[t{j}]" for j in range(n))]
+    for j, k in enumerate(idx):
+        a, b = parts[k]
+        crop = _reframe_crop(video_path, a, b, r["width"], r["height"], work_dir, cfg) if fit == "reframe" else None
+        chain = f"trim=start={a - gs:.3f}:end={b - gs:.3f},setpts=PTS-STARTPTS," + _fit_filter(r, crop)
+        srt = os.path.join(ws, f"part_{k:02d}.srt")
+        if o["captions"] and write_clip_srt(work_dir, a, b, srt):
+            chain += "," + subtitles_filter(srt, caption_style(cfg.get("captions", {}), r["width"], r["height"],
+                                                               r.get("captions")))
+        graph.append(f"[s{j}]{chain}[v{j}]")
+        gain = loudness.clip_filter(video_path, a, b, work_dir, cfg)
+        graph.append(f"[t{j}]atrim=start={a - gs:.3f}:end={b - gs:.3f},asetpts=PTS-STARTPTS,{gain}[a{j}]")
+
+    cmd = ["ffmpeg","-y","-ss", f"{gs:.3f}", "-t", f"{ge - gs:.3f}", "-i", video_path,
+           "-filter_complex", ";".join(graph)]
+    for j, k in enumerate(idx):
+        cmd += ["-map", f"[v{j}]", "-map", f"[a{j}]"]
+        cmd += _video_args(enc, r, codec)
+        cmd += ["-pix_fmt","yuv420p",
+                "-c:a","aac","-b:a", str(r.get("audio_bitrate", enc.get("audio_bitrate", "192k"))),
+                "-ar", str(enc.get("audio_rate", 48000)),
+                outs[k]]
+    return cmd, ge - gs
+
+def render_montage(video_path: str, work_dir: str, cfg: Dict,
+                   out_path: Optional[str] = None) -> Optional[str]:
+    """Cut every part of the saved plan (grouped, in parallel) and concat once."""
+    if not os.path.isfile(plan_path(work_dir)):
+        return None
+    with open(plan_path(work_dir), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    parts = plan_parts(data.get("plan") or {}, data.get("hooks") or {})
+    if not parts:
+        print("⚠️ montage plan has no usable parts")
+        return None
+    o = _opts(cfg)
+    out_path = out_path or os.path.join(work_dir, "montage.mp4")
+    print(f"\n🎞️ Rendering montage: {len(parts)} part(s), {sum(b - a for a, b in parts):.1f}s")
+    t0 = time.time()
+    if loudness.static_enabled(cfg):
+        try:
+            loudness.measure(video_path, work_dir)
+        except Exception as ex:
+            print(f"⚠️ loudness measurement skipped: {ex}")
+
+    ws = tempfile.mkdtemp(prefix="montage_", dir=work_dir)
+    try:
+        outs = [os.path.join(ws, f"part_{k:02d}.mp4") for k in range(len(parts))]
+        groups = group_parts(parts, o["share_gap"], o["max_span"])
+        codec = _geometry(cfg).get("codec", "nvenc")
+
+        def run(codec):
+            jobs = []
+            for idx in groups:
+                cmd, span = _group_cmd(video_path, parts, idx, outs, work_dir, ws, cfg, codec)
+                jobs.append({"cmd": cmd, "duration": span * len(idx)})
+            return [r for r in procman.run_many(jobs) if isinstance(r, BaseException)]
+
+        errs = run(codec)
+        if errs and codec != "x264":
+            # every part must share encoder settings for the stream-copy concat
+            print(f"⚠️ montage: {codec} encode failed, redoing all parts with libx264\n{getattr(errs[0], 'tail', errs[0])}")
+            errs = run("x264")
+        if errs:
+            raise errs[0]
+
+        lst = os.path.join(ws, "concat.txt")
+        with open(lst, "w", encoding="utf-8") as f:
+            for p in outs:
+                f.write(f"file '{os.path.abspath(p)}'\n")
+        part_out = os.path.splitext(out_path)[0] + ".part.mp4"
+        procman.run(["ffmpeg","-y","-f","concat","-safe","0","-i", lst,
+                     "-c","copy","-movflags","+faststart", part_out])
+        os.replace(part_out, out_path)
+    finally:
+        shutil.rmtree(ws, ignore_errors=True)
+    print(f"✅ Montage ({len(groups)} decode(s) for {len(parts)} part(s)) in {time.time()-t0:.1f}s → {out_path}")
+    return out_path
+
+def start_montage(video_path: str, work_dir: str, cfg: Dict) -> Optional[Future]:
+    """render_montage on a background thread, or None when montage output is off."""
+    if not _opts(cfg)["enabled"] or not os.path.isfile(plan_path(work_dir)):
+        return None
+    return _POOL.submit(render_montage, video_path, work_dir, cfg)
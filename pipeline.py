@@ -3,12 +3,24 @@ import re
 import argparse
 import gc
 import json
+import time
+import yaml
 
 from transcriber_torch import transcribe_audio   # using PyTorch Whisper backend
 from highlight_picker import pick_highlights
-from clipper import cut_clips
+from clipper import cut_clips, cut_clip, rendition_finals, prepare_analysis
 from captions_and_style import style_clips
-from titles_tags import generate_titles
+from titles_tags import generate_titles, start_titles
+from work_queue import WorkQueue
+from reel import ReelBuilder
+from preview import cut_previews
+from thumbnails import start_covers, cover_frame
+from montage import start_montage
+import procman
+import resources
+from live import LiveTranscriber
+from hook_mixer import IncrementalHookScorer, refine_hook_boundaries, content_tokens
+from corpus_idf import CorpusIDF, document_key
 
 INPUT_FOLDER = "input"
 OUTPUT_FOLDER = "output"
@@ -31,45 +43,30 @@ def _safe_move(src_path: str, out_dir: str, base_prefix: str) -> str:
             return cand
         n += 1
 
-def concatenate_clips(out_dir: str, combined_filename: str):
-    # combine all *_final.mp4 for this source into one
-    clips = [f for f in os.listdir(out_dir) if f.endswith("_final.mp4")]
-    if not clips:
-        print("⚠️ No final clips to concat.")
-        return None
-    clips.sort()
-    list_path = os.path.join(out_dir, "clip_list.txt")
-    with open(list_path, "w", encoding="utf-8") as f:
-        for c in clips:
-            f.write(f"file '{os.path.join(out_dir, c)}'\n")
-    combined_path = os.path.join(out_dir, combined_filename)
-    import subprocess
-    try:
-        subprocess.run([
-            "ffmpeg","-y",
-            "-f","concat","-safe","0",
-            "-i", list_path,
-            "-c","copy",
-            combined_path
-        ], check=True)
-        print(f"🎬 Combined: {combined_path}")
-        return combined_path
-    except Exception as e:
-        print(f"⚠️ Concat failed: {e}")
-        return None
-    finally:
-        try:
-            os.remove(list_path)
-        except Exception:
-            pass
+def _load_config():
+    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
 
-def run_pipeline(video_path: str):
+def _work_dir(video_path: str):
     basename = os.path.splitext(os.path.basename(video_path))[0]
     work_dir = os.path.join("work", basename)
     os.makedirs(work_dir, exist_ok=True)
+    return basename, work_dir
+
+def _transcript(video_path: str, work_dir: str, reuse: bool = False):
+    cached = os.path.join(work_dir, "transcript.json")
+    if reuse and os.path.isfile(cached) and os.path.isfile(os.path.join(work_dir, "transcript.srt")):
+        print("\n♻️ Reusing cached transcript")
+        with open(cached, "r", encoding="utf-8") as f:
+            return json.load(f)
+    with resources.admit("whisper"):
+        return transcribe_audio(video_path, work_dir, CONFIG_PATH)
+
+def _prepare(video_path: str):
+    basename, work_dir = _work_dir(video_path)
 
     # 1) Transcribe
-    transcript = transcribe_audio(video_path, work_dir, CONFIG_PATH)
+    transcript = _transcript(video_path, work_dir)
 
     # 2) Pick highlights (local hooks + audio peaks; optional GPT mixing)
     highlights = pick_highlights(transcript, work_dir, CONFIG_PATH, video_path=video_path)
@@ -77,37 +74,371 @@ def run_pipeline(video_path: str):
     # free big objects to keep RAM low
     del transcript
     gc.collect()
+    return basename, work_dir, highlights
 
-    # 3) Cut + 4) Style
-    cut_clips(video_path, highlights, work_dir, CONFIG_PATH)
-    style_clips(work_dir, CONFIG_PATH)
+def _reel_appender(reel):
+    """on_final callback for style_clips: a reel error is reported, never taken for a caption failure."""
+    def _on_final(path):
+        if reel is None:
+            return
+        try:
+            reel.add(path)
+        except Exception as e:
+            print(f"⚠️ reel append failed for {os.path.basename(path)}: {e}")
+    return _on_final
+
+def _finish(basename: str, work_dir: str, titles=None, covers=None, montage=None):
+    cfg = _load_config()
+    reel_cfg = cfg.get("reel", {}) or {}
+
+    # 4) Style; each final clip is appended to the combined reel (stream copy) as it lands,
+    #    so the reel holds exactly this run's clips in highlight order.
+    reel = None
+    if bool(reel_cfg.get("enabled", True)):
+        fragmented = bool(reel_cfg.get("fragmented", False))
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+        reel = ReelBuilder(os.path.join(OUTPUT_FOLDER, f"{basename}_combined.mp4"), work_dir,
+                           fragmented=fragmented, resume=bool(reel_cfg.get("resume", False)))
+
+    _on_final = _reel_appender(reel)
 
-    # 5) Titles
-    generate_titles(work_dir, CONFIG_PATH)
+    # renditions are captioned inside the cut encode, so the primary one is already final
+    for path in rendition_finals(work_dir, cfg):
+        _on_final(path)
+    style_clips(work_dir, CONFIG_PATH, on_final=_on_final)
 
-    # 6) Move finals to output (collision-safe names)
+    # 5) Titles (usually already generated in the background while clips encoded)
+    generate_titles(work_dir, CONFIG_PATH, pending=titles)
+
+    # 6) Move finals (+ cover frames) to output (collision-safe names)
+    if covers is not None:
+        try:
+            covers.result()
+        except Exception as e:
+            print(f"⚠️ cover frames failed: {e}")
     final_clips_dir = os.path.join(work_dir, "clips")
     moved = []
     if os.path.isdir(final_clips_dir):
         for file in os.listdir(final_clips_dir):
-            if file.endswith("_final.mp4"):
+            if file.endswith("_final.mp4") or file.endswith("_cover.jpg"):
                 src = os.path.join(final_clips_dir, file)
                 moved_path = _safe_move(src, OUTPUT_FOLDER, basename)
                 moved.append(moved_path)
 
-    # 7) Concat (optional; creates <VideoName>_combined.mp4)
-    if moved:
-        combined_name = f"{basename}_combined.mp4"
-        concatenate_clips(OUTPUT_FOLDER, combined_name)
+    # montage output (rendered in the background from pick_highlights' plan)
+    if montage is not None:
+        try:
+            path = montage.result()
+            if path:
+                moved.append(_safe_move(path, OUTPUT_FOLDER, basename))
+        except Exception as e:
+            print(f"⚠️ Montage failed: {e}")
+
+    # 7) Finalize the combined reel (<VideoName>_combined.mp4)
+    if reel is not None:
+        try:
+            reel.close()
+        except Exception as e:
+            print(f"⚠️ Concat failed: {e}")
+    return moved
+
+def run_pipeline(video_path: str):
+    basename, work_dir, highlights = _prepare(video_path)
+
+    # 3) Cut; titles, cover frames and the optional montage are produced concurrently
+    cfg = _load_config()
+    titles = start_titles(work_dir, CONFIG_PATH, highlights)
+    covers = start_covers(video_path, highlights, work_dir, cfg)
+    montage = start_montage(video_path, work_dir, cfg)
+    cut_clips(video_path, highlights, work_dir, CONFIG_PATH)
+    _finish(basename, work_dir, titles, covers, montage)
 
     print("\n✅ Done! Check the output folder.")
 
+# --------------------------- review: preview + finalize ---------------------------
+
+def run_preview(video_path: str):
+    """Low-res captioned proxies + contact sheet; reuses a cached transcript if present."""
+    basename, work_dir = _work_dir(video_path)
+    transcript = _transcript(video_path, work_dir, reuse=True)
+    highlights = pick_highlights(transcript, work_dir, CONFIG_PATH, video_path=video_path)
+    cut_previews(video_path, highlights, transcript, work_dir, _load_config())
+    del transcript
+    gc.collect()
+
+def run_finalize(video_path: str, ids):
+    """Full-quality encode of the approved highlight IDs from the last preview."""
+    basename, work_dir = _work_dir(video_path)
+    hi_path = os.path.join(work_dir, "highlights.json")
+    if not os.path.isfile(hi_path):
+        print(f"⚠️ No cached highlights for {basename}; run --preview first.")
+        return
+    with open(hi_path, "r", encoding="utf-8") as f:
+        highlights = json.load(f)
+    ids = sorted(set(i for i in ids if 1 <= i <= len(highlights)))
+    if not ids:
+        print(f"⚠️ No valid highlight IDs (1..{len(highlights)}).")
+        return
+
+    # drop leftovers of earlier runs so only the approved clips get styled and moved
+    clips_dir = os.path.join(work_dir, "clips")
+    if os.path.isdir(clips_dir):
+        for f in os.listdir(clips_dir):
+            if f.startswith("clip_"):
+                os.remove(os.path.join(clips_dir, f))
+
+    approved = [highlights[i-1] for i in ids]
+    titles = start_titles(work_dir, CONFIG_PATH, approved, numbers=ids)
+    covers = start_covers(video_path, approved, work_dir, _load_config(), numbers=ids)
+    cut_clips(video_path, approved, work_dir, CONFIG_PATH, numbers=ids)
+    _finish(basename, work_dir, titles, covers)
+    print(f"\n✅ Finalized {len(ids)} clip(s): {', '.join(map(str, ids))}")
+
+# --------------------------- tail mode (growing recordings) ---------------------------
+
+def run_tail(video_path: str):
+    """
+    Follow a growing recording: transcribe new audio in chunks, update window scores
+    incrementally, and cut/style/move each new highlight as soon as it is settled.
+    """
+    basename, work_dir = _work_dir(video_path)
+    cfg = _load_config()
+    # the source is still growing, so a whole-file loudness measurement would be stale
+    cfg["loudness"] = dict(cfg.get("loudness") or {}, mode="loudnorm")
+    clip_cfg = cfg.get("clip", {}) or {}
+    scoring  = cfg.get("scoring", {}) or {}
+    live_cfg = cfg.get("live", {}) or {}
+    min_s, max_s = float(clip_cfg.get("min_seconds", 15)), float(clip_cfg.get("max_seconds", 45))
+    min_score = float(live_cfg.get("min_score", 2.0))
+    max_clips = int(live_cfg.get("max_clips", 0))   # 0 = unlimited
+
+    tail = LiveTranscriber(video_path, work_dir, CONFIG_PATH, cfg)
+    corpus = CorpusIDF.from_config(cfg)
+    scorer = IncrementalHookScorer(window_s=float(scoring.get("window_sec", 10.0)),
+                                   hop_s=float(scoring.get("stride_sec", 5.0)),
+                                   top_k=int(scoring.get("max_clips", 5)),
+                                   iou_thresh=float(scoring.get("iou_thresh", 0.3)),
+                                   corpus=corpus,
+                                   corpus_weight=float((scoring.get("corpus_idf", {}) or {}).get("weight", 0.4)),
+                                   weights=scoring.get("weights") or None)
+    scorer.add(tail.transcript)
+
+    hi_path = os.path.join(work_dir, "highlights.json")
+    highlights = []
+    if os.path.isfile(hi_path):
+        with open(hi_path, "r", encoding="utf-8") as f:
+            highlights = json.load(f)
+    for h in highlights:
+        scorer.exclude(h["start"], h["end"])
+
+    reel_cfg = cfg.get("reel", {}) or {}
+    reel = None
+    if bool(reel_cfg.get("enabled", True)):
+        os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+        # a restarted tail is the same run: keep appending to the reel it already wrote
+        reel = ReelBuilder(os.path.join(OUTPUT_FOLDER, f"{basename}_combined.mp4"), work_dir,
+                           fragmented=bool(reel_cfg.get("fragmented", False)), resume=True)
+
+    on_final = _reel_appender(reel)
+    clips_dir = os.path.join(work_dir, "clips")
+
+    def overlaps(a, b):
+        return min(a["end"], b["end"]) - max(a["start"], b["start"]) > 0
+
+    def on_items(items, committed):
+        scorer.add(items)
+        for h in scorer.top():
+            if max_clips and len(highlights) >= max_clips:
+                return
+            if h["score"] < min_score:
+                continue
+            r = refine_hook_boundaries([h], scorer.items,
+                                       lead_pad=float(clip_cfg.get("buffer_in", 0.25)),
+                                       tail_pad=float(clip_cfg.get("buffer_out", 0.35)),
+                                       merge_next_if_cliff=True, max_refined_len_s=max_s)[0]
+            s, e = round(max(0.0, float(r["start"])), 2), round(float(r["end"]), 2)
+            if e - s < min_s:
+                e = round(s + min_s, 2)   # single sentences are short; pad out to the minimum
+            cand = {"start": s, "end": e}
+            if e > committed:
+                continue   # not fully committed yet; stays a candidate
+            if any(overlaps(cand, x) for x in highlights):
+                scorer.discard(h["id"])
+                continue
+            highlights.append(cand)
+            scorer.exclude(s, e)
+            with open(hi_path, "w", encoding="utf-8") as f:
+                json.dump(highlights, f, indent=2)
+            i = len(highlights)
+            print(f"\n⚡ Live highlight {i}: {s:.1f}–{e:.1f}s (score {h['score']})")
+            try:
+                cut_clip(video_path, cand, i, work_dir, cfg)
+                prefix = f"clip_{i:03}"
+                for p in rendition_finals(work_dir, cfg):
+                    if os.path.basename(p).startswith(prefix + "_"):
+                        on_final(p)
+                style_clips(work_dir, CONFIG_PATH, on_final=on_final)
+                generate_titles(work_dir, CONFIG_PATH)
+                cover = None
+                try:
+                    cover = cover_frame(video_path, cand, i, work_dir, cfg)
+                except Exception as ex:
+                    print(f"⚠️ cover for clip_{i:03} skipped: {ex}")
+                # every rendition's final, or the captioned clip_NNN_final.mp4
+                finals = [os.path.join(clips_dir, f) for f in sorted(os.listdir(clips_dir))
+                          if f.startswith(prefix + "_") and f.endswith("_final.mp4")]
+                for p in finals + ([cover] if cover else []):
+                    _safe_move(p, OUTPUT_FOLDER, basename)
+            except Exception as ex:
+                print(f"⚠️ live clip {i} failed: {ex}")
+
+    tail.follow(on_items)
+    if corpus is not None:
+        corpus.add_document(document_key(basename, scorer.items),
+                            (w for t in scorer.items for w in content_tokens(t.get("text", ""))))
+    if reel is not None:
+        try:
+            reel.close()
+        except Exception as ex:
+            print(f"⚠️ Concat failed: {ex}")
+    print(f"\n✅ Tail done: {len(highlights)} highlight(s) published.")
+
+# --------------------------- multi-node (shared-filesystem queue) ---------------------------
+
+def _video_job_id(video_path: str) -> str:
+    return "video-" + os.path.splitext(os.path.basename(video_path))[0]
+
+def _clip_job_id(basename: str, i: int) -> str:
+    return f"clip-{basename}-{i:03}"
+
+def enqueue_videos(queue: WorkQueue, paths):
+    n = 0
+    for p in paths:
+        if queue.enqueue(_video_job_id(p), "video", {"video_path": p}):
+            n += 1
+    print(f"📥 Enqueued {n} video job(s) in {queue.root}")
+
+def _run_clip_job(job, lease=None):
+    cut_clip(job["video_path"], job["highlight"], int(job["index"]), job["work_dir"], _load_config(),
+             before_publish=lease.verify if lease is not None else None)
+
+def _queued_highlights(queue: WorkQueue, video_path: str) -> list:
+    """Highlights an earlier attempt of this video job already fanned out, in clip order."""
+    basename = os.path.splitext(os.path.basename(video_path))[0]
+    jobs = [queue.load_job(j) for j in queue.job_ids(f"clip-{basename}-")]
+    jobs = sorted((j for j in jobs if j and j.get("video_path") == video_path), key=lambda j: int(j["index"]))
+    return [j["highlight"] for j in jobs]
+
+def _run_video_job(job, queue: WorkQueue, poll_sec: float, lease=None):
+    video_path = job["video_path"]
+    # a retried/stolen job must not re-pick: clip jobs of the earlier attempt may already be
+    # done with its ranges (enqueue won't replace them), and style_clips reads highlights.json
+    highlights = _queued_highlights(queue, video_path)
+    if highlights:
+        basename, work_dir = _work_dir(video_path)
+        print(f"\n♻️ Resuming {basename}: {len(highlights)} clip job(s) already queued")
+        _transcript(video_path, work_dir, reuse=True)
+        with open(os.path.join(work_dir, "highlights.json"), "w", encoding="utf-8") as f:
+            json.dump(highlights, f, indent=2)
+    else:
+        basename, work_dir, highlights = _prepare(video_path)
+
+    # 3) Fan clip encodes out to the queue; this node works them too and steals
+    #    any whose lease expires, then finishes the video once all are done.
+    prepare_analysis(video_path, highlights, work_dir, _load_config())
+    print(f"\n✂️ Queueing {len(highlights)} clip(s)…")
+    ids = []
+    for i, hl in enumerate(highlights, start=1):
+        jid = _clip_job_id(basename, i)
+        queue.enqueue(jid, "clip", {"video_path": video_path, "work_dir": work_dir,
+                                    "index": i, "highlight": hl}, priority=1)
+        ids.append(jid)
+    cfg = _load_config()
+    titles = start_titles(work_dir, CONFIG_PATH, highlights)
+    covers = start_covers(video_path, highlights, work_dir, cfg)
+    montage = start_montage(video_path, work_dir, cfg)
+    if not queue.wait_for(ids, poll_sec=poll_sec, handler=_run_clip_job):
+        raise RuntimeError(f"clip jobs for {basename} exhausted their retries")
+    if lease is not None:
+        lease.verify()   # only the current owner styles and moves the outputs
+    return {"clips": len(_finish(basename, work_dir, titles, covers, montage))}
+
+def run_worker(queue: WorkQueue, poll_sec: float = 2.0, forever: bool = False):
+    """
+    Claim jobs until the queue is drained (or forever). Clip jobs are taken before
+    new videos so in-flight videos finish first.
+    """
+    print(f"👷 Worker {queue.owner} on {queue.root}")
+    while True:
+        lease = queue.claim_next(kinds=["clip", "video"])
+        if lease is None:
+            if not forever and not queue.pending():
+                print("\n✅ Queue drained.")
+                return
+            time.sleep(poll_sec)
+            continue
+        print(f"\n▶️ {lease.id}")
+        try:
+            with lease:
+                if lease.job["kind"] == "clip":
+                    _run_clip_job(lease.job, lease)
+                else:
+                    result = _run_video_job(lease.job, queue, poll_sec, lease)
+                    lease.complete(result)
+        except Exception:
+            pass  # already recorded in failed/ by the lease
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", help="Path to a single video to process")
+    parser.add_argument("--enqueue", action="store_true", help="Add every .mp4 in input/ (or --input) to the shared queue")
+    parser.add_argument("--worker", action="store_true", help="Process jobs from the shared queue until it is drained")
+    parser.add_argument("--forever", action="store_true", help="With --worker: keep polling instead of exiting when idle")
+    parser.add_argument("--preview", action="store_true", help="Fast low-res captioned proxies + contact_sheet.json for review")
+    parser.add_argument("--finalize", metavar="IDS", help="Full-quality encode of approved highlight IDs, e.g. 1,3,4")
+    parser.add_argument("--tail", metavar="PATH", help="Follow a growing recording (.ts/.mkv) and cut highlights as they happen")
     args = parser.parse_args()
 
-    if args.input and os.path.exists(args.input):
+    # node RAM/core budget + one shared process manager for every ffmpeg call;
+    # kill children on SIGTERM/SIGINT
+    resources.configure(_load_config())
+    procman.configure(_load_config())
+    procman.install_signal_handlers()
+
+    def _first_input():
+        if args.input and os.path.exists(args.input):
+            return args.input
+        os.makedirs(INPUT_FOLDER, exist_ok=True)
+        for file in sorted(os.listdir(INPUT_FOLDER)):
+            if file.lower().endswith(".mp4"):
+                return os.path.join(INPUT_FOLDER, file)
+        return None
+
+    if args.tail:
+        run_tail(args.tail)
+    elif args.enqueue or args.worker:
+        cfg = _load_config()
+        queue = WorkQueue.from_config(cfg)
+        if args.enqueue:
+            if args.input:
+                paths = [args.input]
+            else:
+                os.makedirs(INPUT_FOLDER, exist_ok=True)
+                paths = [os.path.join(INPUT_FOLDER, f) for f in sorted(os.listdir(INPUT_FOLDER))
+                         if f.lower().endswith(".mp4")]
+            enqueue_videos(queue, paths)
+        if args.worker:
+            run_worker(queue, poll_sec=float((cfg.get("queue", {}) or {}).get("poll_sec", 2)),
+                       forever=args.forever)
+    elif args.preview or args.finalize:
+        path = _first_input()
+        if path is None:
+            print("No .mp4 file found in input/")
+        elif args.preview:
+            run_preview(path)
+        else:
+            run_finalize(path, [int(x) for x in re.split(r"[,\s]+", args.finalize.strip()) if x])
+    elif args.input and os.path.exists(args.input):
         run_pipeline(args.input)
     else:
         if not os.path.isdir(INPUT_FOLDER):
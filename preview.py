@@ -0,0 +1,81 @@
+# preview.py
+# Review proxies: tiny captioned clips + a contact sheet, so editors can approve highlight IDs
+# before paying for the full-quality encode (pipeline.py --finalize <ids>).
+
+import os, json, time
+from typing import List, Dict
+from clipper import cut_renditions, map_clips, prepare_analysis
+
+def _excerpt(transcript: List[Dict], start: float, end: float, max_chars: int = 280) -> str:
+    text = " ".join(t["text"].strip() for t in transcript
+                    if float(t["end"]) > start and float(t["start"]) < end).strip()
+    return (text[:max_chars] + "…") if len(text) > max_chars else text
+
+def preview_rendition(cfg: Dict) -> Dict:
+    p = cfg.get("preview", {}) or {}
+    return {
+        "name": "preview",
+        "width": int(p.get("width", 360)),
+        "height": int(p.get("height", 640)),
+        "fps": int(p.get("fps", 30)),
+        "fit": p.get("fit"),   # unset: follow reframe.enabled like the final encode
+        "codec": "x264",
+        "x264_preset": p.get("preset", "ultrafast"),
+        "crf": int(p.get("crf", 30)),
+        "maxrate": p.get("maxrate", "1M"),
+        "bufsize": p.get("bufsize", "2M"),
+        "gop": int(p.get("fps", 30)) * 2,
+        "audio_bitrate": p.get("audio_bitrate", "64k"),
+    }
+
+def cut_previews(video_path: str, highlights: List[Dict], transcript: List[Dict],
+                 work_dir: str, cfg: Dict) -> str:
+    """
+    Writes <work_dir>/preview/clip_NNN.mp4 for every highlight plus contact_sheet.json,
+    encoded side by side like cut_clips; side files stay in preview/ too. Loudness
+    normalization is skipped for proxies. Returns the contact sheet path.
+    """
+    print("\n👀 Cutting preview proxies…")
+    out_dir = os.path.join(work_dir, "preview")
+    os.makedirs(out_dir, exist_ok=True)
+    rend = preview_rendition(cfg)
+
+    t0 = time.time()
+    prepare_analysis(video_path, highlights, work_dir, cfg, measure_loudness=False)
+
+    def proxy(i, hl):
+        out = os.path.join(out_dir, f"clip_{i:03}.mp4")
+        try:
+            cut_renditions(video_path, hl, i, work_dir, cfg, rs=[rend], outputs=[out], audio_filter="anull",
+                           sub="preview")
+            return out
+        except Exception as e:
+            print(f"⚠️ preview for clip_{i:03} failed: {e}")
+            return None
+
+    numbers = list(range(1, len(highlights) + 1))
+    proxies = map_clips(proxy, numbers, highlights, cfg)
+    clips = []
+    for i, hl, out in zip(numbers, highlights, proxies):
+        s, e = float(hl["start"]), float(hl["end"])
+        clips.append({
+            "id": i,
+            "start": s,
+            "end": e,
+            "duration": round(e - s, 2),
+            "excerpt": _excerpt(transcript, s, e),
+            "proxy": out,
+        })
+
+    sheet = {
+        "video": video_path,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "proxy_size": f"{rend['width']}x{rend['height']}@{rend['fps']}",
+        "finalize": f"python pipeline.py --input \"{video_path}\" --finalize " + ",".join(str(c["id"]) for c in clips),
+        "clips": clips,
+    }
+    sheet_path = os.path.join(out_dir, "contact_sheet.json")
+    with open(sheet_path, "w", encoding="utf-8") as f:
+        json.dump(sheet, f, indent=2, ensure_ascii=False)
+    print(f"✅ {len(clips)} preview(s) in {time.time()-t0:.1f}s → {sheet_path}")
+    return sheet_path
@@ -0,0 +1,305 @@
+# procman.py
+# Shared asyncio process manager for every ffmpeg/ffprobe call in the pipeline.
+#
+#   - one event loop on a daemon thread; sync callers block on run(), async code awaits run_async()
+#   - global concurrency limit (process.max_concurrent)
+#   - per-job timeout = timeout_base + timeout_per_sec * media duration (or default_timeout)
+#   - stderr tail kept for diagnostics; ProcessError carries it (subclass of CalledProcessError,
+#     so existing `except subprocess.CalledProcessError` fallbacks keep working)
+#   - NVENC sessions are a per-GPU limit (process.nvenc_sessions): a job holds one slot per
+#     h264_nvenc/hevc_nvenc output it opens, e.g. every rendition of a one-decode fan-out
+#   - with an on_progress callback, ffmpeg `-progress` is parsed into events for it
+#   - shutdown() terminates everything still running (atexit + SIGTERM/SIGINT)
+#   - each job also needs a ticket from the node RAM/core budget (resources.py); its peak RSS
+#     and CPU use are sampled from /proc and fed back as the learned cost of its stage
+
+import asyncio, atexit, signal, subprocess, threading, time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import resources
+
+class ProcessError(subprocess.CalledProcessError):
+    def __init__(self, returncode: int, cmd: List[str], tail: str, timed_out: bool = False,
+                 stdout: bytes = b"", stderr: bytes = b""):
+        super().__init__(returncode, cmd, output=stdout, stderr=stderr)
+        self.tail = tail
+        self.timed_out = timed_out
+
+    def __str__(self):
+        head = f"{self.cmd[0]} timed out" if self.timed_out else f"{self.cmd[0]} exited with {self.returncode}"
+        return f"{head}\n{self.tail}" if self.tail else head
+
+class ProcResult:
+    def __init__(self, returncode: int, stdout: bytes, stderr: bytes, elapsed: float):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.elapsed = elapsed
+
+def _parse_progress(block: Dict[str, str], duration: Optional[float]) -> Dict:
+    ev = {"state": block.get("progress", "continue")}
+    us = block.get("out_time_us") or block.get("out_time_ms")   # both are microseconds
+    if us and us.lstrip("-").isdigit():
+        ev["time"] = max(0.0, int(us) / 1e6)
+        if duration:
+            ev["pct"] = min(100.0, 100.0 * ev["time"] / duration)
+    for k in ("frame", "fps", "speed", "total_size"):
+        if k in block:
+            ev[k] = block[k].strip()
+    return ev
+
+def classify(cmd: List[str]) -> Tuple[str, float]:
+    """(stage, units) for the resource budget: encodes count their encoded video outputs."""
+    if cmd[0].endswith("ffprobe"):
+        return "probe", 1.0
+    encoders = [cmd[k + 1] for k, c in enumerate(cmd[:-1]) if c in ("-c:v", "-vcodec", "-codec:v")]
+    n = sum(1 for c in encoders if c != "copy")
+    if n:
+        return "encode", float(n)
+    if "rawvideo" in cmd or ("-f" in cmd and "null" in cmd):
+        return "decode", 1.0
+    return "ffmpeg", 1.0
+
+async def _sample(pid: int, out: Dict, interval: float = 0.25):
+    """Peak RSS (VmHWM) and CPU seconds of a child until cancelled."""
+    while True:
+        hwm = resources._rss_mb(pid, "VmHWM")
+        cpu = resources._cpu_sec(pid)
+        if hwm is not None:
+            out["peak_mb"] = max(out.get("peak_mb", 0.0), hwm)
+        if cpu is not None:
+            out["cpu"] = cpu
+        await asyncio.sleep(interval)
+
+class ProcessManager:
+    def __init__(self, max_concurrent: int = 2, stderr_lines: int = 40,
+                 timeout_base: float = 120.0, timeout_per_sec: float = 6.0,
+                 default_timeout: float = 3600.0, nvenc_sessions: int = 3):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.nvenc_sessions = max(1, int(nvenc_sessions))
+        self.stderr_lines = int(stderr_lines)
+        self.timeout_base = float(timeout_base)
+        self.timeout_per_sec = float(timeout_per_sec)
+        self.default_timeout = float(default_timeout)
+        self._procs = set()
+        self._closing = False
+        self._nvenc_used = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="procman", daemon=True)
+        self._thread.start()
+        self._sem, self._nvenc = asyncio.run_coroutine_threadsafe(self._make_sems(), self._loop).result()
+
+    async def _make_sems(self):
+        return asyncio.Semaphore(self.max_concurrent), asyncio.Condition()
+
+    async def _nvenc_acquire(self, n: int):
+        async with self._nvenc:
+            await self._nvenc.wait_for(lambda: self._nvenc_used + n <= self.nvenc_sessions)
+            self._nvenc_used += n
+
+    async def _nvenc_release(self, n: int):
+        async with self._nvenc:
+            self._nvenc_used -= n
+            self._nvenc.notify_all()
+
+    def timeout_for(self, duration: Optional[float], factor: Optional[float] = None) -> float:
+        if not duration:
+            return self.default_timeout
+        per = self.timeout_per_sec if factor is None else float(factor)
+        return self.timeout_base + per * float(duration)
+
+    async def run_async(self, cmd: List[str], duration: Optional[float] = None,
+                        timeout: Optional[float] = None, timeout_factor: Optional[float] = None,
+                        capture_stdout: bool = False, capture_stderr: bool = False,
+                        on_progress: Optional[Callable[[Dict], None]] = None,
+                        check: bool = True, stage: Optional[str] = None,
+                        units: Optional[float] = None) -> ProcResult:
+        cmd = [str(c) for c in cmd]
+        auto_stage, auto_units = classify(cmd)
+        stage, units = stage or auto_stage, units if units is not None else auto_units
+        # one session per NVENC output; a fan-out wider than the limit runs alone
+        nvenc = min(self.nvenc_sessions, sum(1 for c in cmd if c.endswith("_nvenc")))
+        progress = cmd[0] == "ffmpeg" and on_progress is not None and not capture_stdout
+        if progress:
+            cmd = [cmd[0], "-nostats", "-progress", "pipe:1"] + cmd[1:]
+        elif cmd[0] == "ffmpeg":
+            cmd = [cmd[0], "-nostats"] + cmd[1:]
+        if timeout is None:
+            timeout = self.timeout_for(duration, timeout_factor)
+
+        async with self._sem:
+            if nvenc:
+                await self._nvenc_acquire(nvenc)
+            try:
+                return await self._admitted(cmd, stage, units, duration, timeout, progress,
+                                            capture_stdout, capture_stderr, on_progress, check)
+            finally:
+                if nvenc:
+                    await self._nvenc_release(nvenc)
+
+    async def _admitted(self, cmd, stage, units, duration, timeout, progress,
+                        capture_stdout, capture_stderr, on_progress, check) -> ProcResult:
+        budget = resources.manager()
+        ticket = budget.try_acquire(stage, units)
+        while ticket is None:
+            if self._closing:
+                raise asyncio.CancelledError()
+            await asyncio.sleep(0.2)
+            ticket = budget.try_acquire(stage, units)
+        usage, sampler = {}, None
+        try:
+            if self._closing:
+                raise asyncio.CancelledError()
+            t0 = time.time()
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE if (progress or capture_stdout) else asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE)
+            self._procs.add(proc)
+            sampler = asyncio.ensure_future(_sample(proc.pid, usage))
+            tail = deque(maxlen=self.stderr_lines)
+            err_all, out_all = bytearray(), bytearray()
+
+            async def read_stderr():
+                async for line in proc.stderr:
+                    if capture_stderr:
+                        err_all.extend(line)
+                    tail.append(line.decode("utf-8", "replace").rstrip())
+
+            async def read_stdout():
+                if capture_stdout:
+                    while True:
+                        chunk = await proc.stdout.read(1 << 20)
+                        if not chunk:
+                            return
+                        out_all.extend(chunk)
+                block = {}
+                async for line in proc.stdout:
+                    k, _, v = line.decode("utf-8", "replace").strip().partition("=")
+                    block[k] = v
+                    if k == "progress":
+                        if on_progress:
+                            try:
+                                on_progress(_parse_progress(block, duration))
+                            except Exception:
+                                pass
+                        block = {}
+
+            readers = [read_stderr()]
+            if proc.stdout is not None:
+                readers.append(read_stdout())
+            timed_out = False
+            try:
+                await asyncio.wait_for(asyncio.gather(*readers, proc.wait()), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                await self._kill(proc)
+            except asyncio.CancelledError:
+                await self._kill(proc)
+                raise
+            finally:
+                self._procs.discard(proc)
+            rc = proc.returncode if proc.returncode is not None else -9
+            usage["ok"] = rc == 0 and not timed_out
+            usage["elapsed"] = time.time() - t0
+            if check and (rc != 0 or timed_out):
+                raise ProcessError(rc, cmd, "\n".join(tail), timed_out=timed_out,
+                                   stdout=bytes(out_all), stderr=bytes(err_all))
+            return ProcResult(rc, bytes(out_all), bytes(err_all) if capture_stderr else "\n".join(tail).encode(),
+                              usage["elapsed"])
+        finally:
+            if sampler is not None:
+                sampler.cancel()
+            # only clean runs teach the budget; very short ones are sampled too coarsely for CPU
+            ok, dt = usage.get("ok", False), usage.get("elapsed", 0.0)
+            budget.release(ticket,
+                           usage.get("peak_mb") if ok else None,
+                           usage["cpu"] / dt if ok and "cpu" in usage and dt >= 1.0 else None)
+
+    async def _kill(self, proc, grace: float = 5.0):
+        if proc.returncode is not None:
+            return
+        try:
+            proc.terminate()
+            await asyncio.wait_for(proc.wait(), grace)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+        except ProcessLookupError:
+            pass
+
+    # ---- sync facade ----
+    def run(self, cmd: List[str], **kw) -> ProcResult:
+        return asyncio.run_coroutine_threadsafe(self.run_async(cmd, **kw), self._loop).result()
+
+    def run_many(self, jobs: List[Dict], return_exceptions: bool = True) -> List:
+        """jobs: [{"cmd": [...], **run kwargs}]; runs concurrently under the shared limit."""
+        async def _all():
+            return await asyncio.gather(*(self.run_async(j["cmd"], **{k: v for k, v in j.items() if k != "cmd"})
+                                          for j in jobs), return_exceptions=return_exceptions)
+        return asyncio.run_coroutine_threadsafe(_all(), self._loop).result()
+
+    def shutdown(self):
+        """Cancel queued jobs and terminate every running process."""
+        if self._closing:
+            return
+        self._closing = True
+        async def _stop():
+            await asyncio.gather(*(self._kill(p, grace=2.0) for p in list(self._procs)), return_exceptions=True)
+        try:
+            asyncio.run_coroutine_threadsafe(_stop(), self._loop).result(timeout=10)
+        except Exception:
+            pass
+
+# --------------------------- module-level singleton ---------------------------
+
+_MANAGER: Optional[ProcessManager] = None
+_LOCK = threading.Lock()
+
+def configure(cfg: Dict) -> ProcessManager:
+    """(Re)create the shared manager from the `process` config section."""
+    global _MANAGER
+    p = cfg.get("process", {}) or {}
+    with _LOCK:
+        if _MANAGER is not None:
+            _MANAGER.shutdown()
+        _MANAGER = ProcessManager(
+            max_concurrent=int(p.get("max_concurrent", 2)),
+            stderr_lines=int(p.get("stderr_lines", 40)),
+            timeout_base=float(p.get("timeout_base", 120)),
+            timeout_per_sec=float(p.get("timeout_per_sec", 6)),
+            default_timeout=float(p.get("default_timeout", 3600)),
+            nvenc_sessions=int(p.get("nvenc_sessions", 3)),
+        )
+    return _MANAGER
+
+def manager() -> ProcessManager:
+    global _MANAGER
+    with _LOCK:
+        if _MANAGER is None:
+            _MANAGER = ProcessManager()
+        return _MANAGER
+
+def run(cmd: List[str], **kw) -> ProcResult:
+    return manager().run(cmd, **kw)
+
+def run_many(jobs: List[Dict], return_exceptions: bool = True) -> List:
+    return manager().run_many(jobs, return_exceptions=return_exceptions)
+
+def shutdown():
+    if _MANAGER is not None:
+        _MANAGER.shutdown()
+
+def install_signal_handlers():
+    """SIGTERM/SIGINT -> kill child ffmpeg processes, then exit. Call from the main thread."""
+    def _handler(signum, frame):
+        shutdown()
+        raise SystemExit(128 + signum)
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            signal.signal(sig, _handler)
+        except (ValueError, OSError):
+            pass
+
+atexit.register(shutdown)
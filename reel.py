@@ -0,0 +1,328 @@
+# reel.py
+# Combined-reel assembly by stream copy, appended clip by clip as each final clip is produced.
+#
+# Two container modes:
+#   - mp4 (default): each clip is remuxed to MPEG-TS with a running timestamp offset and
+#     appended to <work>/reel.ts; close() does one stream-copy remux to a faststart MP4.
+#   - fragmented: each clip is remuxed to fragmented MP4 and its moof/mdat fragments are
+#     appended straight onto the output file (tfdt/mfhd rewritten), so the reel is valid
+#     and playable after every add().
+# Each builder starts a fresh reel unless resume=True (tail mode restarts, or reel.resume),
+# which keeps appending to the existing one: the fragmented file itself, or in mp4 mode the
+# leftover reel.ts of an unfinished run (else the finished MP4, remuxed back to TS).
+#
+# Every clip is probed before it is copied; a clip whose codec parameters differ from the
+# first one is skipped with a warning instead of forcing a re-encode of the whole reel.
+
+import os, json, struct, subprocess
+import procman
+from typing import Dict, Optional
+
+# parameters that must match for copy-concat to be valid
+_VIDEO_KEYS = ("codec_name", "profile", "width", "height", "pix_fmt", "r_frame_rate")
+_AUDIO_KEYS = ("codec_name", "sample_rate", "channels")
+
+def probe_params(path: str) -> Dict:
+    out = procman.run([
+        "ffprobe","-v","error",
+        "-show_entries","stream=codec_type,codec_name,profile,width,height,pix_fmt,r_frame_rate,sample_rate,channels",
+        "-show_entries","format=duration",
+        "-of","json", path
+    ], timeout=60, capture_stdout=True).stdout.decode("utf-8", "replace")
+    info = json.loads(out or "{}")
+    params = {"duration": float((info.get("format") or {}).get("duration") or 0.0)}
+    for st in info.get("streams", []):
+        kind = st.get("codec_type")
+        if kind == "video" and "video" not in params:
+            params["video"] = {k: st.get(k) for k in _VIDEO_KEYS}
+        elif kind == "audio" and "audio" not in params:
+            params["audio"] = {k: st.get(k) for k in _AUDIO_KEYS}
+    return params
+
+def _mismatch(ref: Dict, cur: Dict) -> Optional[str]:
+    for kind in ("video", "audio"):
+        a, b = ref.get(kind), cur.get(kind)
+        if (a is None) != (b is None):
+            return f"{kind} stream present in only one clip"
+        if a is None:
+            continue
+        for k, v in a.items():
+            if b.get(k) != v:
+                return f"{kind} {k}: {b.get(k)} != {v}"
+    return None
+
+# --------------------------- ISO-BMFF box helpers (fragmented mode) ---------------------------
+
+def _iter_boxes(buf: bytes, start: int = 0, end: Optional[int] = None):
+    """Yields (type, box_start, payload_start, box_end)."""
+    pos, end = start, len(buf) if end is None else end
+    while pos + 8 <= end:
+        size, typ = struct.unpack(">I4s", buf[pos:pos+8])
+        hdr = 8
+        if size == 1:
+            size = struct.unpack(">Q", buf[pos+8:pos+16])[0]
+            hdr = 16
+        elif size == 0:
+            size = end - pos
+        if size < hdr or pos + size > end:
+            break
+        yield typ.decode("latin-1"), pos, pos + hdr, pos + size
+        pos += size
+
+def _child(buf: bytes, start: int, end: int, typ: str):
+    for t, b, p, e in _iter_boxes(buf, start, end):
+        if t == typ:
+            return b, p, e
+    return None
+
+def _track_info(buf: bytes, moov) -> Dict[int, Dict]:
+    """track_id -> {timescale, default_duration} from moov/trak/mdhd and moov/mvex/trex."""
+    tracks = {}
+    _, mp, me = moov
+    for t, b, p, e in _iter_boxes(buf, mp, me):
+        if t != "trak":
+            continue
+        tkhd = _child(buf, p, e, "tkhd")
+        mdia = _child(buf, p, e, "mdia")
+        if not tkhd or not mdia:
+            continue
+        ver = buf[tkhd[1]]
+        tid = struct.unpack(">I", buf[tkhd[1]+(20 if ver == 1 else 12):][:4])[0]
+        mdhd = _child(buf, mdia[1], mdia[2], "mdhd")
+        ver = buf[mdhd[1]]
+        ts = struct.unpack(">I", buf[mdhd[1]+(20 if ver == 1 else 12):][:4])[0]
+        tracks[tid] = {"timescale": ts, "default_duration": 0}
+    mvex = _child(buf, mp, me, "mvex")
+    if mvex:
+        for t, b, p, e in _iter_boxes(buf, mvex[1], mvex[2]):
+            if t == "trex":
+                tid, _, dur = struct.unpack(">III", buf[p+4:p+16])
+                if tid in tracks:
+                    tracks[tid]["default_duration"] = dur
+    return tracks
+
+def _stsd_signature(buf: bytes, moov) -> bytes:
+    """Concatenated sample descriptions (codec config incl. SPS/PPS) of all tracks."""
+    sig = b""
+    _, mp, me = moov
+    for t, b, p, e in _iter_boxes(buf, mp, me):
+        if t != "trak":
+            continue
+        mdia = _child(buf, p, e, "mdia")
+        minf = mdia and _child(buf, mdia[1], mdia[2], "minf")
+        stbl = minf and _child(buf, minf[1], minf[2], "stbl")
+        stsd = stbl and _child(buf, stbl[1], stbl[2], "stsd")
+        if stsd:
+            sig += buf[stsd[0]:stsd[2]]
+    return sig
+
+def _rewrite_fragment(buf: bytearray, moof, tracks: Dict[int, Dict], offset_s: float, seq: int) -> Dict[int, int]:
+    """
+    Shift tfdt by offset_s (per-track timescale) and renumber mfhd in place.
+    Returns track_id -> decode end time (in track timescale, before shifting).
+    """
+    ends = {}
+    _, mp, me = moof
+    for t, b, p, e in _iter_boxes(buf, mp, me):
+        if t == "mfhd":
+            struct.pack_into(">I", buf, p + 4, seq)
+        elif t == "traf":
+            tfhd = _child(buf, p, e, "tfhd")
+            flags = struct.unpack(">I", buf[tfhd[1]:tfhd[1]+4])[0] & 0xFFFFFF
+            tid = struct.unpack(">I", buf[tfhd[1]+4:tfhd[1]+8])[0]
+            q = tfhd[1] + 8
+            if flags & 0x01: q += 8   # base_data_offset
+            if flags & 0x02: q += 4   # sample_description_index
+            default_dur = tracks.get(tid, {}).get("default_duration", 0)
+            if flags & 0x08:
+                default_dur = struct.unpack(">I", buf[q:q+4])[0]
+            base = 0
+            tfdt = _child(buf, p, e, "tfdt")
+            shift = int(round(offset_s * tracks.get(tid, {}).get("timescale", 1)))
+            if tfdt:
+                ver = buf[tfdt[1]]
+                if ver == 1:
+                    base = struct.unpack(">Q", buf[tfdt[1]+4:tfdt[1]+12])[0]
+                    struct.pack_into(">Q", buf, tfdt[1] + 4, base + shift)
+                else:
+                    base = struct.unpack(">I", buf[tfdt[1]+4:tfdt[1]+8])[0]
+                    struct.pack_into(">I", buf, tfdt[1] + 4, (base + shift) & 0xFFFFFFFF)
+            total = 0
+            for tt, tb, tp, te in _iter_boxes(buf, p, e):
+                if tt != "trun":
+                    continue
+                tflags = struct.unpack(">I", buf[tp:tp+4])[0] & 0xFFFFFF
+                count = struct.unpack(">I", buf[tp+4:tp+8])[0]
+                r = tp + 8
+                if tflags & 0x001: r += 4
+                if tflags & 0x004: r += 4
+                per = 4 * bin(tflags & 0xF00).count("1")
+                if tflags & 0x100:
+                    for k in range(count):
+                        total += struct.unpack(">I", buf[r + k*per:r + k*per + 4])[0]
+                else:
+                    total += default_dur * count
+            ends[tid] = max(ends.get(tid, 0), base + total)
+    return ends
+
+# --------------------------- builder ---------------------------
+
+class ReelBuilder:
+    def __init__(self, out_path: str, work_dir: str, fragmented: bool = False, resume: bool = False):
+        self.out_path = out_path
+        self.fragmented = fragmented
+        self.work_dir = os.path.join(work_dir, "reel")
+        os.makedirs(self.work_dir, exist_ok=True)
+        self.ts_path = os.path.join(self.work_dir, "reel.ts")
+        self.ref: Optional[Dict] = None
+        self.offset = 0.0
+        self.count = 0
+        # fragmented-mode state
+        self.seq = 0
+        self.tracks: Dict[int, Dict] = {}
+        self.stsd = b""
+        self.resumed = False
+        if resume:
+            self._resume_fragmented() if fragmented else self._resume_ts()
+        elif fragmented:
+            if os.path.exists(self.out_path):
+                os.remove(self.out_path)   # this run's clips only
+        elif os.path.exists(self.ts_path):
+            os.remove(self.ts_path)
+
+    def _resume_ts(self):
+        """Keep appending to reel.ts, rebuilt from the finished reel if close() already ran."""
+        if not os.path.isfile(self.ts_path) and not os.path.isfile(self.out_path):
+            return
+        try:
+            if not os.path.isfile(self.ts_path):
+                procman.run([
+                    "ffmpeg","-y","-i", self.out_path,
+                    "-map","0:v:0?","-map","0:a:0?",
+                    "-c","copy","-bsf:v","h264_mp4toannexb",
+                    "-f","mpegts", self.ts_path
+                ], timeout_factor=1.0, duration=probe_params(self.out_path)["duration"])
+            self.offset = probe_params(self.ts_path)["duration"]
+        except (subprocess.CalledProcessError, ValueError) as e:
+            print(f"⚠️ reel: cannot resume {os.path.basename(self.out_path)} ({e}); starting over")
+            if os.path.exists(self.ts_path):
+                os.remove(self.ts_path)
+            return
+        self.ref = {"resumed": True}
+        self.resumed = True
+
+    def _resume_fragmented(self):
+        """Pick up an existing fragmented reel and keep appending to it."""
+        if not os.path.isfile(self.out_path):
+            return
+        with open(self.out_path, "rb") as f:
+            buf = bytearray(f.read())
+        moov = _child(buf, 0, len(buf), "moov")
+        if not moov or not _child(buf, moov[1], moov[2], "mvex"):
+            os.remove(self.out_path)  # not a fragmented reel; start over
+            return
+        self.tracks = _track_info(buf, moov)
+        self.stsd = _stsd_signature(buf, moov)
+        end_s = 0.0
+        for t, b, p, e in _iter_boxes(buf):
+            if t == "moof":
+                self.seq += 1
+                for tid, end in _rewrite_fragment(buf, (b, p, e), self.tracks, 0.0, self.seq).items():
+                    end_s = max(end_s, end / float(self.tracks[tid]["timescale"]))
+        self.offset = end_s
+        self.ref = {"resumed": True}
+        self.resumed = True
+
+    def add(self, clip_path: str) -> bool:
+        try:
+            params = probe_params(clip_path)
+        except (subprocess.CalledProcessError, ValueError) as e:
+            print(f"⚠️ reel: cannot probe {os.path.basename(clip_path)}: {e}")
+            return False
+        if self.ref is None or self.ref.get("resumed"):
+            self.ref = params
+        else:
+            why = _mismatch(self.ref, params)
+            if why:
+                print(f"⚠️ reel: skipping {os.path.basename(clip_path)} ({why}); copy concat needs identical params")
+                return False
+        ok = self._add_fragmented(clip_path, params) if self.fragmented else self._add_ts(clip_path, params)
+        if ok:
+            self.count += 1
+        return ok
+
+    def _add_ts(self, clip_path: str, params: Dict) -> bool:
+        part = os.path.join(self.work_dir, "part.ts")
+        procman.run([
+            "ffmpeg","-y","-i", clip_path,
+            "-map","0:v:0?","-map","0:a:0?",
+            "-c","copy","-bsf:v","h264_mp4toannexb",
+            "-output_ts_offset", f"{self.offset:.6f}",
+            "-f","mpegts", part
+        ], timeout_factor=1.0, duration=params["duration"])
+        with open(part, "rb") as src, open(self.ts_path, "ab") as dst:
+            while True:
+                chunk = src.read(1 << 20)
+                if not chunk:
+                    break
+                dst.write(chunk)
+        os.remove(part)
+        self.offset += params["duration"]
+        return True
+
+    def _add_fragmented(self, clip_path: str, params: Dict) -> bool:
+        part = os.path.join(self.work_dir, "part.mp4")
+        procman.run([
+            "ffmpeg","-y","-i", clip_path,
+            "-map","0:v:0?","-map","0:a:0?",
+            "-c","copy",
+            "-movflags","frag_keyframe+empty_moov+default_base_moof",
+            part
+        ], timeout_factor=1.0, duration=params["duration"])
+        with open(part, "rb") as f:
+            buf = bytearray(f.read())
+        os.remove(part)
+        moov = _child(buf, 0, len(buf), "moov")
+        if not moov:
+            print(f"⚠️ reel: no moov in fragmented remux of {os.path.basename(clip_path)}")
+            return False
+        stsd = _stsd_signature(buf, moov)
+        header = b""
+        if not self.tracks:
+            self.tracks = _track_info(buf, moov)
+            self.stsd = stsd
+            ftyp = _child(buf, 0, len(buf), "ftyp")
+            header = bytes(buf[ftyp[0]:ftyp[2]] if ftyp else b"") + bytes(buf[moov[0]:moov[2]])
+        elif stsd != self.stsd:
+            print(f"⚠️ reel: skipping {os.path.basename(clip_path)} (codec config differs from reel init segment)")
+            return False
+        out = bytearray(header)
+        end_s = self.offset
+        for t, b, p, e in _iter_boxes(buf):
+            if t == "moof":
+                self.seq += 1
+                ends = _rewrite_fragment(buf, (b, p, e), self.tracks, self.offset, self.seq)
+                for tid, end in ends.items():
+                    end_s = max(end_s, self.offset + end / float(self.tracks[tid]["timescale"]))
+                out += buf[b:e]
+            elif t == "mdat":
+                out += buf[b:e]
+        with open(self.out_path, "ab" if not header else "wb") as f:
+            f.write(out)
+        self.offset = end_s
+        return True
+
+    def close(self) -> Optional[str]:
+        if self.count == 0 and not self.resumed:
+            print("⚠️ No final clips to concat.")
+            return None
+        if not self.fragmented:
+            procman.run([
+                "ffmpeg","-y","-i", self.ts_path,
+                "-c","copy","-bsf:a","aac_adtstoasc",
+                "-movflags","+faststart",
+                self.out_path
+            ], timeout_factor=1.0, duration=self.offset)
+            os.remove(self.ts_path)
+        print(f"🎬 Combined: {self.out_path}  ({self.count} new clip(s), {self.offset:.1f}s)")
+        return self.out_path
@@ -0,0 +1,272 @@
+# reframe.py
+# Subject-tracking auto-reframe: sparse low-res sampling -> face / salient-region centre per
+# sample -> smoothed crop path -> ffmpeg `crop` expression, so the real encode does the
+# reframe with no extra decode. Paths are cached per source in <work_dir>/reframe.json.
+
+import os, re, json, subprocess, threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import cv2
+
+import procman
+
+from reel import probe_params
+
+_CACHE_LOCK = threading.Lock()
+_LOCAL = threading.local()
+_NO_FACE_WARNED = threading.Event()
+
+def face_detector():
+    """
+    This thread's Haar frontal-face cascade (shared with thumbnails), or None where the
+    OpenCV build ships without it. One per thread: detectMultiScale keeps per-image state
+    in the classifier and releases the GIL, so concurrent calls on one instance race.
+    """
+    det = getattr(_LOCAL, "face", None)
+    if det is None:
+        det = False
+        if hasattr(cv2, "CascadeClassifier") and hasattr(cv2, "data"):
+            try:
+                c = cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, "haarcascade_frontalface_default.xml"))
+                if not c.empty():   # a missing XML loads as an empty classifier
+                    det = c
+            except cv2.error:
+                pass
+        if det is False and not _NO_FACE_WARNED.is_set():
+            _NO_FACE_WARNED.set()
+            print("⚠️ OpenCV has no Haar cascades; reframe and cover scoring ignore faces")
+        _LOCAL.face = det
+    return det or None
+
+@lru_cache(maxsize=32)
+def _source_size(video_path: str) -> Tuple[int, int]:
+    src = probe_params(video_path).get("video") or {}
+    return int(src.get("width") or 0), int(src.get("height") or 0)
+
+def _opts(cfg: Dict) -> Dict:
+    r = cfg.get("reframe", {}) or {}
+    return {
+        "sample": (r.get("sample") or "keyframes").lower(),   # keyframes | fps
+        "sample_fps": float(r.get("sample_fps", 2.0)),
+        "analysis_width": int(r.get("analysis_width", 320)),
+        "smoothing": float(r.get("smoothing", 0.85)),          # EMA factor, 0 = none
+        "dead_zone": float(r.get("dead_zone", 0.04)),          # ignore centre moves < 4% of frame
+        "max_keys": int(r.get("max_keys", 16)),                # crop expression breakpoints
+        "threads": int(r.get("threads", 4)),
+    }
+
+# --------------------------- sampling ---------------------------
+
+def _sample_frames(video_path: str, start: float, dur: float, o: Dict) -> Tuple[np.ndarray, List[float]]:
+    """Gray frames (N,h,w) at analysis width + clip-relative timestamps."""
+    sw, sh = _source_size(video_path)
+    if not sw or not sh:
+        return np.zeros((0, 1, 1), np.uint8), []
+    aw = o["analysis_width"]
+    ah = max(2, int(round(sh * aw / sw / 2)) * 2)
+
+    def run(keyframes: bool):
+        cmd = ["ffmpeg","-hide_banner","-nostdin"]
+        if keyframes:
+            cmd += ["-skip_frame","nokey"]
+        cmd += ["-ss", f"{start:.3f}", "-t", f"{dur:.3f}", "-i", video_path, "-an"]
+        vf = f"scale={aw}:{ah}:flags=area,format=gray,showinfo"
+        if not keyframes:
+            vf = f"fps={o['sample_fps']}," + vf
+        cmd += ["-vf", vf, "-fps_mode","passthrough", "-f","rawvideo", "pipe:1"]
+        p = procman.run(cmd, duration=dur, timeout_factor=1.0, capture_stdout=True, capture_stderr=True)
+        n = len(p.stdout) // (aw * ah)
+        frames = np.frombuffer(p.stdout[:n*aw*ah], np.uint8).reshape(n, ah, aw)
+        times = [float(x) for x in re.findall(rb"pts_time:\s*([0-9.eE+-]+)", p.stderr)][:n]
+        if len(times) < n:
+            times += [times[-1] if times else 0.0] * (n - len(times))
+        return frames, times
+
+    frames, times = run(o["sample"] == "keyframes")
+    if len(frames) < 3 and o["sample"] == "keyframes":
+        frames, times = run(False)   # sparse GOPs: fall back to a fixed-rate sample
+    return frames, times
+
+# --------------------------- detection ---------------------------
+
+def _centre(frame: np.ndarray, prev: Optional[np.ndarray]) -> Tuple[float, float, float]:
+    """(cx, cy, confidence) normalized to [0,1]; faces win, else motion+edge energy."""
+    h, w = frame.shape
+    det = face_detector()
+    faces = () if det is None else det.detectMultiScale(frame, scaleFactor=1.15, minNeighbors=4,
+                                                        minSize=(max(12, w // 24), max(12, w // 24)))
+    if len(faces):
+        f = np.asarray(faces, np.float32)
+        area = f[:, 2] * f[:, 3]
+        cx = float(((f[:, 0] + f[:, 2] / 2) * area).sum() / area.sum()) / w
+        cy = float(((f[:, 1] + f[:, 3] / 2) * area).sum() / area.sum()) / h
+        return cx, cy, 1.0
+    g = frame.astype(np.float32)
+    energy = np.abs(np.diff(g, axis=1, prepend=g[:, :1])) + np.abs(np.diff(g, axis=0, prepend=g[:1]))
+    if prev is not None:
+        energy += 2.0 * np.abs(g - prev.astype(np.float32))
+    col, row = energy.sum(axis=0), energy.sum(axis=1)
+    tot = float(col.sum())
+    if tot <= 1e-6:
+        return 0.5, 0.5, 0.0
+    cx = float((col * np.arange(w)).sum() / tot) / w
+    cy = float((row * np.arange(h)).sum() / tot) / h
+    # peakedness of the column profile as a weak confidence
+    conf = float(min(1.0, col.max() / (col.mean() + 1e-6) / 8.0)) * 0.5
+    return cx, cy, conf
+
+# --------------------------- path smoothing ---------------------------
+
+def _smooth(vals: np.ndarray, conf: np.ndarray, alpha: float, dead: float) -> np.ndarray:
+    if len(vals) == 0:
+        return vals
+    # low-confidence samples lean towards the previous estimate
+    out = vals.copy()
+    for k in range(1, len(out)):
+        w = 0.25 + 0.75 * conf[k]
+        out[k] = w * vals[k] + (1 - w) * out[k-1]
+    # zero-phase EMA (forward + backward)
+    for k in range(1, len(out)):
+        out[k] = alpha * out[k-1] + (1 - alpha) * out[k]
+    for k in range(len(out) - 2, -1, -1):
+        out[k] = alpha * out[k+1] + (1 - alpha) * out[k]
+    # dead zone: hold position until the subject really moves
+    held = out.copy()
+    for k in range(1, len(held)):
+        if abs(out[k] - held[k-1]) < dead:
+            held[k] = held[k-1]
+    return held
+
+def _simplify(ts: List[float], vs: List[float], max_keys: int, eps: float = 0.01) -> List[Tuple[float, float]]:
+    """Ramer–Douglas–Peucker on (t, v), loosening eps until <= max_keys points remain."""
+    pts = list(zip(ts, vs))
+    if len(pts) <= 2:
+        return pts
+    def rdp(a, b, e, keep):
+        (t0, v0), (t1, v1) = pts[a], pts[b]
+        best, idx = 0.0, -1
+        for k in range(a + 1, b):
+            t, v = pts[k]
+            lerp = v0 + (v1 - v0) * (t - t0) / (t1 - t0 + 1e-9)
+            d = abs(v - lerp)
+            if d > best:
+                best, idx = d, k
+        if best > e and idx != -1:
+            keep.add(idx)
+            rdp(a, idx, e, keep)
+            rdp(idx, b, e, keep)
+    while True:
+        keep = {0, len(pts) - 1}
+        rdp(0, len(pts) - 1, eps, keep)
+        if len(keep) <= max_keys:
+            return [pts[k] for k in sorted(keep)]
+        eps *= 1.5
+
+# --------------------------- cache + public API ---------------------------
+
+def _key(start: float, end: float, o: Dict) -> str:
+    return f"{start:.2f}-{end:.2f}:{o['sample']}:{o['sample_fps']}:{o['analysis_width']}"
+
+def _cache_path(work_dir: str) -> str:
+    return os.path.join(work_dir, "reframe.json")
+
+def _load_cache(work_dir: str) -> Dict:
+    try:
+        with open(_cache_path(work_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _store(work_dir: str, key: str, path: Dict):
+    with _CACHE_LOCK:
+        cache = _load_cache(work_dir)
+        cache[key] = path
+        tmp = _cache_path(work_dir) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmp, _cache_path(work_dir))
+
+def subject_path(video_path: str, start: float, end: float, work_dir: str, cfg: Dict) -> Optional[Dict]:
+    """
+    Smoothed subject centre over [start, end] as {"t": [...], "x": [...], "y": [...]}
+    (clip-relative seconds, normalized coords). Cached per source range.
+    """
+    o = _opts(cfg)
+    key = _key(start, end, o)
+    cached = _load_cache(work_dir).get(key)
+    if cached is not None:
+        return cached or None
+    try:
+        frames, times = _sample_frames(video_path, start, max(0.01, end - start), o)
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️ reframe sampling failed: {e}")
+        return None
+    if len(frames) == 0:
+        _store(work_dir, key, {})
+        return None
+    xs, ys, cs = [], [], []
+    prev = None
+    for fr in frames:
+        cx, cy, c = _centre(fr, prev)
+        xs.append(cx); ys.append(cy); cs.append(c)
+        prev = fr
+    conf = np.asarray(cs, np.float32)
+    sx = _smooth(np.asarray(xs, np.float32), conf, o["smoothing"], o["dead_zone"])
+    sy = _smooth(np.asarray(ys, np.float32), conf, o["smoothing"], o["dead_zone"])
+    path = {"t": [round(t, 3) for t in times],
+            "x": [round(float(v), 4) for v in sx],
+            "y": [round(float(v), 4) for v in sy]}
+    _store(work_dir, key, path)
+    return path
+
+def prepare_paths(video_path: str, ranges: List[Tuple[float, float]], work_dir: str, cfg: Dict):
+    """Warm the cache for all clip ranges in parallel (ffmpeg + OpenCV release the GIL)."""
+    o = _opts(cfg)
+    with ThreadPoolExecutor(max_workers=max(1, o["threads"])) as ex:
+        list(ex.map(lambda r: subject_path(video_path, r[0], r[1], work_dir, cfg), ranges))
+
+def _piecewise(keys: List[Tuple[float, float]]) -> str:
+    """Piecewise-linear ffmpeg expression of t through (t, value) keys, held at both ends."""
+    if len(keys) == 1:
+        return f"{keys[0][1]:.1f}"
+    expr = f"{keys[-1][1]:.1f}"
+    for (t0, v0), (t1, v1) in reversed(list(zip(keys[:-1], keys[1:]))):
+        if t1 - t0 <= 1e-6:
+            continue
+        seg = f"{v0:.1f}+({v1 - v0:.1f})*(t-{t0:.3f})/{t1 - t0:.3f}"
+        expr = f"if(lt(t,{t1:.3f}),{seg},{expr})"
+    return f"if(lt(t,{keys[0][0]:.3f}),{keys[0][1]:.1f},{expr})"
+
+def crop_filter(video_path: str, start: float, end: float, width: int, height: int,
+                work_dir: str, cfg: Dict) -> Optional[str]:
+    """
+    `crop=...` tracking the subject at the target aspect (width:height), or None when the
+    source already fits / no path is available. Follow it with scale=width:height.
+    """
+    sw, sh = _source_size(video_path)
+    if not sw or not sh:
+        return None
+    target = width / float(height)
+    if abs(sw / float(sh) - target) < 0.01:
+        return None
+    path = subject_path(video_path, start, end, work_dir, cfg)
+    if not path or not path.get("t"):
+        return None
+    o = _opts(cfg)
+    if sw / float(sh) > target:
+        cw, ch = int(sh * target) // 2 * 2, sh // 2 * 2
+        span, centres, axis = sw - cw, path["x"], "x"
+        size = cw
+        full = sw
+    else:
+        cw, ch = sw // 2 * 2, int(sw / target) // 2 * 2
+        span, centres, axis = sh - ch, path["y"], "y"
+        size = ch
+        full = sh
+    pos = [min(max(c * full - size / 2.0, 0.0), float(span)) for c in centres]
+    keys = _simplify(path["t"], pos, o["max_keys"], eps=max(1.0, 0.01 * full))
+    expr = _piecewise(keys)
+    x, y = (f"'{expr}'", "0") if axis == "x" else ("0", f"'{expr}'")
+    return f"crop=w={cw}:h={ch}:x={x}:y={y}"
@@ -0,0 +1,287 @@
+# resources.py
+# Node-wide RAM / core budget with admission control per stage.
+#
+#   - every heavy stage asks for a ticket before it starts: ffmpeg/ffprobe jobs (via procman),
+#     Whisper, full-file librosa loads
+#   - the ticket size comes from costs learned on earlier runs (peak RSS, average cores), kept
+#     in resources.stats as an EMA per stage, scaled by a stage-specific unit (audio minutes,
+#     encoded outputs); config priors are used until a stage has been measured
+#   - in-process stages are measured from this process's RSS, so only a stage's first (cold)
+#     run with no other in-process stage alongside is learned from
+#   - a long-lived in-process resource (the tail's resident Whisper model) holds a memory-only
+#     reservation; its per-chunk work takes core-only tickets
+#   - a ticket is admitted while the sum of running tickets fits the budget and the kernel
+#     still reports enough MemAvailable; a ticket bigger than the whole budget runs alone
+#   - the budget is per process: run one pipeline/worker process per node
+
+import os, json, time, atexit, threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+PRIORS = {   # mem_mb / cores per unit until measured
+    "whisper":  {"mem_mb": 2500, "cores": 4.0},
+    "audio":    {"mem_mb": 4.0,  "cores": 1.0},   # per minute of 16 kHz audio held by librosa
+    "encode":   {"mem_mb": 450,  "cores": 2.0},   # per encoded output
+    "decode":   {"mem_mb": 250,  "cores": 1.0},   # analysis decodes to rawvideo/null
+    "probe":    {"mem_mb": 40,   "cores": 0.2},
+    "ffmpeg":   {"mem_mb": 200,  "cores": 1.0},   # anything else (remux, wav extract, stills)
+}
+_MEM_ONLY_UNITS = {"audio"}   # units scale memory but not cores
+
+def _meminfo(key: str) -> Optional[float]:
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+def _rss_mb(pid="self", field: str = "VmRSS") -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _cpu_sec(pid) -> Optional[float]:
+    """utime + stime of a process, in seconds."""
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / float(os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+class Ticket:
+    def __init__(self, stage: str, units: float, mem_mb: float, cores: float):
+        self.stage = stage
+        self.units = units
+        self.mem_mb = mem_mb
+        self.cores = cores
+        self.t0 = time.time()
+
+class ResourceManager:
+    def __init__(self, ram_mb: float, cores: float, stats_path: Optional[str] = None,
+                 priors: Optional[Dict] = None, headroom: float = 1.2, alpha: float = 0.3,
+                 enabled: bool = True):
+        self.ram_mb = float(ram_mb)
+        self.cores = float(cores)
+        self.stats_path = stats_path
+        self.priors = {k: dict(v) for k, v in PRIORS.items()}
+        for k, v in (priors or {}).items():
+            self.priors.setdefault(k, {}).update(v)
+        self.headroom = float(headroom)
+        self.alpha = float(alpha)
+        self.enabled = enabled
+        self.used_mb = 0.0
+        self.used_cores = 0.0
+        self.running = 0
+        self._inproc = 0        # admit() blocks running now
+        self._admits = 0        # admit() blocks started so far
+        self._warm = set()      # in-process stages already run (allocator/caches warm)
+        self._cond = threading.Condition()
+        self._save_lock = threading.Lock()
+        self._stats = self._load()
+        self._dirty = False
+        self._saved = 0.0
+
+    # ---- learned costs ----
+    def _load(self) -> Dict:
+        if not self.stats_path:
+            return {}
+        try:
+            with open(self.stats_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self, force: bool = False):
+        """Write learned costs (throttled to one write per 5 s unless forced)."""
+        if not self.stats_path or not self._dirty or (not force and time.time() - self._saved < 5.0):
+            return
+        with self._save_lock:
+            with self._cond:
+                data = json.dumps(self._stats, indent=2)
+                self._dirty = False
+            self._saved = time.time()
+            os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+            tmp = f"{self.stats_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.stats_path)
+
+    def estimate(self, stage: str, units: float = 1.0) -> Tuple[float, float]:
+        """(mem_mb, cores) a stage of `units` is expected to take."""
+        units = max(1e-3, float(units))
+        s = self._stats.get(stage) or self.priors.get(stage) or self.priors["ffmpeg"]
+        mem = float(s["mem_mb"]) * units * self.headroom
+        cores = float(s["cores"]) * (1.0 if stage in _MEM_ONLY_UNITS else max(1.0, units))
+        return mem, min(self.cores, cores)
+
+    def record(self, stage: str, units: float, peak_mb: Optional[float], cores: Optional[float]):
+        """Fold one measurement (per unit) into the stage's EMA."""
+        if peak_mb is None and cores is None:
+            return
+        units = max(1e-3, float(units))
+        with self._cond:
+            s = self._stats.setdefault(stage, dict(self.priors.get(stage) or self.priors["ffmpeg"], n=0))
+            a = self.alpha if s.get("n", 0) else 1.0   # first measurement replaces the prior
+            if peak_mb is not None:
+                s["mem_mb"] = round((1 - a) * float(s["mem_mb"]) + a * peak_mb / units, 2)
+            if cores is not None:
+                per = cores if stage in _MEM_ONLY_UNITS else cores / max(1.0, units)
+                s["cores"] = round((1 - a) * float(s["cores"]) + a * per, 3)
+            s["n"] = int(s.get("n", 0)) + 1
+            self._dirty = True
+        self.save()
+
+    # ---- admission ----
+    def _fits(self, mem: float, cores: float) -> bool:
+        if self.running == 0:
+            return True   # never deadlock: an oversized job runs alone
+        if self.used_mb + mem > self.ram_mb or self.used_cores + cores > self.cores + 1e-6:
+            return False
+        avail = _meminfo("MemAvailable")
+        return avail is None or avail >= mem
+
+    def try_acquire(self, stage: str, units: float = 1.0, mem: bool = True,
+                    cores: bool = True) -> Optional[Ticket]:
+        """mem / cores: which part of the estimate the ticket holds (see reserve())."""
+        est_mem, est_cores = self.estimate(stage, units)
+        mem, cores = est_mem if mem else 0.0, est_cores if cores else 0.0
+        with self._cond:
+            if self.enabled and not self._fits(mem, cores):
+                return None
+            self.used_mb += mem
+            self.used_cores += cores
+            self.running += 1
+            return Ticket(stage, units, mem, cores)
+
+    def acquire(self, stage: str, units: float = 1.0, mem: bool = True, cores: bool = True) -> Ticket:
+        waited = False
+        while True:
+            t = self.try_acquire(stage, units, mem=mem, cores=cores)
+            if t is not None:
+                return t
+            if not waited:
+                waited = True
+                print(f"  • waiting for resources: {stage} "
+                      f"(~{self.estimate(stage, units)[0] if mem else 0.0:.0f} MB; {self.used_mb:.0f}/{self.ram_mb:.0f} MB, "
+                      f"{self.used_cores:.1f}/{self.cores:.0f} cores in use)")
+            with self._cond:
+                self._cond.wait(timeout=1.0)   # MemAvailable can change without a release
+
+    def release(self, ticket: Ticket, peak_mb: Optional[float] = None, cores: Optional[float] = None):
+        with self._cond:
+            self.used_mb = max(0.0, self.used_mb - ticket.mem_mb)
+            self.used_cores = max(0.0, self.used_cores - ticket.cores)
+            self.running = max(0, self.running - 1)
+            self._cond.notify_all()
+        self.record(ticket.stage, ticket.units, peak_mb, cores)
+
+    def reserve(self, stage: str, units: float = 1.0) -> Ticket:
+        """
+        Memory-only ticket for something that stays resident between uses (a loaded model);
+        the work done with it takes core-only tickets, acquire(stage, mem=False). Release it
+        with release() once the resource is dropped; nothing is learned from it.
+        """
+        return self.acquire(stage, units, cores=False)
+
+    @contextmanager
+    def admit(self, stage: str, units: float = 1.0):
+        """
+        In-process stage: hold a ticket and measure this process's RSS growth meanwhile.
+        RSS also moves with other threads and allocator reuse, so the cost is only learned
+        from a cold run of the stage that no other admit() block overlapped.
+        """
+        ticket = self.acquire(stage, units)
+        with self._cond:
+            clean = self._inproc == 0 and stage not in self._warm
+            seq = self._admits
+            self._admits += 1
+            self._inproc += 1
+        base = _rss_mb() or 0.0
+        peak = [base]
+        cpu0 = _cpu_sec(os.getpid())
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(0.25):
+                r = _rss_mb()
+                if r is not None and r > peak[0]:
+                    peak[0] = r
+
+        th = threading.Thread(target=sample, name=f"rss-{stage}", daemon=True)
+        th.start()
+        try:
+            yield ticket
+        finally:
+            stop.set()
+            th.join()
+            with self._cond:
+                clean = clean and self._admits == seq + 1   # nothing started alongside
+                self._inproc -= 1
+                self._warm.add(stage)
+            r = _rss_mb()
+            peak[0] = max(peak[0], r or 0.0)
+            cpu1 = _cpu_sec(os.getpid())
+            dt = max(1e-3, time.time() - ticket.t0)
+            cores = (cpu1 - cpu0) / dt if cpu0 is not None and cpu1 is not None else None
+            # RSS growth is only meaningful if something was actually allocated
+            grown = peak[0] - base if peak[0] - base > 1.0 else None
+            if clean:
+                self.release(ticket, grown, cores)
+            else:
+                self.release(ticket)
+
+# --------------------------- module-level singleton ---------------------------
+
+_MANAGER: Optional[ResourceManager] = None
+_LOCK = threading.Lock()
+
+def _auto(v, fallback: float) -> float:
+    return fallback if v in (None, "auto", 0) else float(v)
+
+def configure(cfg: Dict) -> ResourceManager:
+    """(Re)create the node budget from the `resources` config section."""
+    global _MANAGER
+    r = cfg.get("resources", {}) or {}
+    total = _meminfo("MemTotal") or 8192.0
+    rm = ResourceManager(
+        ram_mb=_auto(r.get("ram_mb"), float(r.get("ram_fraction", 0.8)) * total),
+        cores=_auto(r.get("cores"), float(os.cpu_count() or 2)),
+        stats_path=r.get("stats", os.path.join("work", "_cache", "resources.json")),
+        priors=r.get("priors") or {},
+        headroom=float(r.get("headroom", 1.2)),
+        enabled=bool(r.get("enabled", True)),
+    )
+    with _LOCK:
+        if _MANAGER is not None:
+            _MANAGER.save(force=True)
+        _MANAGER = rm
+    return rm
+
+def manager() -> ResourceManager:
+    global _MANAGER
+    with _LOCK:
+        if _MANAGER is None:
+            _MANAGER = ResourceManager(ram_mb=0.8 * (_meminfo("MemTotal") or 8192.0),
+                                       cores=float(os.cpu_count() or 2))
+        return _MANAGER
+
+def admit(stage: str, units: float = 1.0):
+    return manager().admit(stage, units)
+
+def _save_on_exit():
+    if _MANAGER is not None:
+        try:
+            _MANAGER.save(force=True)
+        except OSError:
+            pass
+
+atexit.register(_save_on_exit)
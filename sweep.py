@@ -0,0 +1,283 @@
+# sweep.py
+# Parameter sweep for highlight scoring on cached work dirs (no ffmpeg, Whisper or GPT):
+#
+#   - loads work/<video>/transcript.json and the cached RMS envelope (audio16k.rms250_125.npz)
+#     of every video that has labeled "good clip" intervals (sweep.labels)
+#   - per (window_sec, stride_sec) the windows, rarity and lexicon features of each video are
+#     computed once, in the process pool, and packed into one shared-memory block
+#   - a config is then a dot product with its weights, the audio-peak boost and the
+#     non-overlapping pick per video, so workers attached to that block get through hundreds
+#     of configs quickly; picks are scored against the labels (precision, recall, AP, nDCG @ top_k)
+#   - python sweep.py [--config config.yaml] [--workers N] [--show 15]
+#     -> <sweep.out>/results.json + results.csv; copy the winner into `scoring:`
+#
+# It evaluates the local window ranking (hook_mixer.find_hooks + the peak boost), before
+# boundary refinement, the clip length filter and GPT ordering; corpus IDF is left out since
+# the labeled videos are usually already counted in it.
+
+import os, csv, json, math, time, argparse, itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import yaml
+
+from hook_mixer import WEIGHTS, make_segments, segment_tokens, rarity_scores, segment_features
+from audio_peaks import rms_envelope, peaks_from_envelope
+
+FEATURES = list(WEIGHTS)
+_COLS = 3   # start, end, near_peak; then FEATURES
+
+def _opts(cfg: Dict) -> Dict:
+    s = cfg.get("sweep", {}) or {}
+    return {
+        "work_root": s.get("work_root", "work"),
+        "labels": s.get("labels", os.path.join("work", "_labels.json")),
+        "out": s.get("out", os.path.join("work", "_sweep")),
+        "top_k": int(s.get("top_k", (cfg.get("scoring", {}) or {}).get("max_clips", 5))),
+        "hit_overlap": float(s.get("hit_overlap", 0.5)),   # share of a pick inside a label to count as a hit
+        "peak_radius": float(s.get("peak_radius", 2.0)),
+        "metric": (s.get("metric") or "ndcg").lower(),     # ndcg | ap | precision | recall
+        "workers": int(s.get("workers", 0)),               # 0 = all cores
+        "grid": s.get("grid", {}) or {},
+    }
+
+# --------------------------- inputs ---------------------------
+
+def load_labels(path: str) -> Dict[str, List[Tuple[float, float]]]:
+    """{video: [[start, end], ...]} (or lists of {start, end}); video = work dir name."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    out = {}
+    for name, ivs in raw.items():
+        rows = [(float(iv["start"]), float(iv["end"])) if isinstance(iv, dict) else (float(iv[0]), float(iv[1]))
+                for iv in ivs]
+        rows = [(a, b) for a, b in rows if b > a]
+        if rows:
+            out[name] = sorted(rows)
+    return out
+
+def _peak_times(work_dir: str) -> np.ndarray:
+    """energy_peaks() of the cached envelope; empty when the audio was never analyzed."""
+    wav = os.path.join(work_dir, "audio16k.wav")
+    if not os.path.isfile(wav):
+        return np.zeros(0)
+    try:
+        times, rms = rms_envelope(wav)
+    except ImportError:
+        return np.zeros(0)   # no cache and no librosa to build it
+    return np.array([t for t, _ in peaks_from_envelope(times, rms)])
+
+def _features(work_dir: str, window: float, stride: float, radius: float) -> np.ndarray:
+    """Rows of [start, end, near_peak, *FEATURES] for every scoring window of one video."""
+    with open(os.path.join(work_dir, "transcript.json"), "r", encoding="utf-8") as f:
+        transcript = json.load(f)
+    segments = make_segments(transcript, window, stride)
+    if not segments:
+        return np.zeros((0, _COLS + len(FEATURES)))
+    rar = rarity_scores(segments, segment_tokens(segments))
+    peaks = _peak_times(work_dir)
+    rows = []
+    for s in segments:
+        f = segment_features(s, rar.get(s["id"], 0.0))
+        mid = 0.5 * (s["start"] + s["end"])
+        near = bool(len(peaks)) and bool((np.abs(peaks - s["start"]) <= radius).any() or
+                                         (np.abs(peaks - mid) <= radius).any())
+        rows.append([s["start"], s["end"], float(near)] + [f[k] for k in FEATURES])
+    return np.asarray(rows, np.float64)
+
+def _feature_job(args):
+    return _features(*args)
+
+# --------------------------- grid ---------------------------
+
+def _values(v) -> list:
+    return list(v) if isinstance(v, (list, tuple)) else [v]
+
+def expand_grid(grid: Dict, scoring: Dict) -> List[Dict]:
+    """Cartesian product of the grid; anything not listed keeps the current `scoring` value."""
+    base = {
+        "window_sec": float(scoring.get("window_sec", 10.0)),
+        "stride_sec": float(scoring.get("stride_sec", 5.0)),
+        "iou_thresh": float(scoring.get("iou_thresh", 0.3)),
+        "peak_boost": float(scoring.get("peak_boost", 0.5)),
+    }
+    wgrid = grid.get("weights", {}) or {}
+    current_w = scoring.get("weights") or {}
+    unknown = (set(wgrid) | set(current_w)) - set(WEIGHTS)
+    if unknown:
+        raise ValueError(f"unknown scoring weight(s): {', '.join(sorted(unknown))}")
+    keys = list(base)
+    axes = [[float(x) for x in _values(grid.get(k, base[k]))] for k in keys]
+    wkeys = list(wgrid)
+    waxes = [[float(x) for x in _values(wgrid[k])] for k in wkeys]
+    configs = []
+    for combo in itertools.product(*axes):
+        for wcombo in itertools.product(*waxes):
+            c = dict(zip(keys, combo))
+            w = dict(current_w, **dict(zip(wkeys, wcombo)))
+            c["weights"] = {k: float(v) for k, v in w.items() if float(v) != WEIGHTS[k]}   # overrides only
+            configs.append(c)
+    current = dict(base, weights={k: float(v) for k, v in current_w.items() if float(v) != WEIGHTS[k]})
+    if current not in configs:
+        configs.append(current)
+    return configs
+
+# --------------------------- evaluation (worker side) ---------------------------
+
+_DATA: Optional[np.ndarray] = None
+_SHM = None
+_INDEX: Dict = {}
+_LABELS: List[np.ndarray] = []
+_EVAL: Dict = {}
+
+def _attach(shm_name: str, shape: Tuple[int, int], index: Dict, labels: List[np.ndarray], ev: Dict):
+    global _DATA, _SHM, _INDEX, _LABELS, _EVAL
+    _SHM = shared_memory.SharedMemory(name=shm_name)   # the parent unlinks it
+    _DATA = np.ndarray(shape, np.float64, buffer=_SHM.buf)
+    _INDEX, _LABELS, _EVAL = index, labels, ev
+
+def pick(rows: np.ndarray, w: np.ndarray, boost: float, iou_thresh: float, top_k: int) -> List[int]:
+    """hook_mixer.pick_top_nonoverlapping on precomputed feature rows."""
+    score = np.round(rows[:, _COLS:] @ w, 4) + boost * rows[:, 2]
+    st, en = rows[:, 0], rows[:, 1]
+    chosen: List[int] = []
+    for k in np.argsort(-score, kind="stable"):
+        if len(chosen) >= top_k:
+            break
+        c = np.asarray(chosen, int)
+        inter = np.clip(np.minimum(en[k], en[c]) - np.maximum(st[k], st[c]), 0.0, None)
+        union = (en[k] - st[k]) + (en[c] - st[c]) - inter + 1e-9
+        if (inter / union <= iou_thresh).all():
+            chosen.append(int(k))
+    return chosen
+
+def rank_metrics(picks: np.ndarray, labels: np.ndarray, top_k: int, hit_overlap: float) -> Dict[str, float]:
+    """
+    picks: (n, 2) ranked; labels: (m, 2). A pick hits a label when at least hit_overlap of it lies
+    inside; only the first pick on each label earns ranking gain (AP, nDCG). Recall is capped at top_k.
+    """
+    ideal = min(len(labels), top_k)
+    if ideal == 0:
+        return {"precision": 0.0, "recall": 0.0, "ap": 0.0, "ndcg": 0.0}
+    found, hits, ap, dcg = set(), 0, 0.0, 0.0
+    for r, (a, b) in enumerate(picks[:top_k], 1):
+        inside = np.clip(np.minimum(b, labels[:, 1]) - np.maximum(a, labels[:, 0]), 0.0, None) / max(b - a, 1e-9)
+        matched = set(np.nonzero(inside >= hit_overlap)[0].tolist())
+        if not matched:
+            continue
+        hits += 1
+        new = matched - found
+        if new:
+            found.add(min(new, key=lambda j: -inside[j]))
+            ap += len(found) / r
+            dcg += 1.0 / math.log2(r + 1)
+    idcg = sum(1.0 / math.log2(r + 1) for r in range(1, ideal + 1))
+    return {"precision": hits / top_k, "recall": len(found) / ideal, "ap": ap / ideal, "ndcg": dcg / idcg}
+
+def _evaluate(config: Dict) -> Dict[str, float]:
+    w = np.array([dict(WEIGHTS, **config["weights"])[k] for k in FEATURES])
+    geom = (config["window_sec"], config["stride_sec"])
+    per_video = []
+    for v, labels in enumerate(_LABELS):
+        r0, r1 = _INDEX[(geom, v)]
+        rows = _DATA[r0:r1]
+        chosen = pick(rows, w, config["peak_boost"], config["iou_thresh"], _EVAL["top_k"])
+        per_video.append(rank_metrics(rows[chosen, :2], labels, _EVAL["top_k"], _EVAL["hit_overlap"]))
+    return {m: round(float(np.mean([p[m] for p in per_video])), 4) for m in per_video[0]}
+
+def _eval_chunk(configs: List[Dict]) -> List[Dict[str, float]]:
+    return [_evaluate(c) for c in configs]
+
+# --------------------------- driver ---------------------------
+
+def run_sweep(config_path: str = "config.yaml", workers: Optional[int] = None) -> List[Dict]:
+    with open(config_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    o = _opts(cfg)
+    labels = load_labels(o["labels"])
+    videos = [v for v in sorted(labels) if os.path.isfile(os.path.join(o["work_root"], v, "transcript.json"))]
+    for v in sorted(set(labels) - set(videos)):
+        print(f"⚠️ no cached transcript for labeled video {v}; skipped")
+    if not videos:
+        raise SystemExit(f"❌ nothing to sweep: no labeled video in {o['labels']} has a transcript.json")
+    configs = expand_grid(o["grid"], cfg.get("scoring", {}) or {})
+    geoms = sorted({(c["window_sec"], c["stride_sec"]) for c in configs})
+    workers = workers or o["workers"] or os.cpu_count() or 1
+    print(f"\n🔬 Sweep: {len(configs)} config(s) × {len(videos)} video(s), "
+          f"{len(geoms)} window geometr{'y' if len(geoms) == 1 else 'ies'}, {workers} worker(s)")
+    t0 = time.time()
+
+    # 1) features once per (geometry, video)
+    jobs = [(g, v) for g in geoms for v in range(len(videos))]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        feats = list(ex.map(_feature_job, [(os.path.join(o["work_root"], videos[v]), g[0], g[1], o["peak_radius"])
+                                           for g, v in jobs]))
+    index, r = {}, 0
+    for (g, v), rows in zip(jobs, feats):
+        index[(g, v)] = (r, r + len(rows))
+        r += len(rows)
+    shape = (max(1, r), _COLS + len(FEATURES))
+    print(f"  • features: {r} window(s) in {time.time()-t0:.1f}s")
+
+    # 2) one shared block, every config evaluated against it
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+    try:
+        data = np.ndarray(shape, np.float64, buffer=shm.buf)
+        for key, rows in zip(jobs, feats):
+            a, b = index[key]
+            data[a:b] = rows
+        del feats
+        lab = [np.asarray(labels[v], np.float64) for v in videos]
+        ev = {"top_k": o["top_k"], "hit_overlap": o["hit_overlap"]}
+        size = max(1, len(configs) // (workers * 8))
+        chunks = [configs[i:i + size] for i in range(0, len(configs), size)]
+        t1 = time.time()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=(shm.name, shape, index, lab, ev)) as ex:
+            metrics = [m for part in ex.map(_eval_chunk, chunks) for m in part]
+        del data
+    finally:
+        shm.close()
+        shm.unlink()
+    print(f"  • evaluated in {time.time()-t1:.1f}s ({len(configs)/max(time.time()-t1, 1e-9):.0f} config/s)")
+
+    key = o["metric"] if o["metric"] in metrics[0] else "ndcg"
+    scoring = cfg.get("scoring", {}) or {}
+    current = expand_grid({}, scoring)[0]
+    results = [dict(c, **m, current=(c == current)) for c, m in zip(configs, metrics)]
+    results.sort(key=lambda x: (x[key], x["ndcg"], x["ap"]), reverse=True)
+    _write(results, o["out"])
+    print(f"✅ Sweep done in {time.time()-t0:.1f}s → {os.path.join(o['out'], 'results.json')}")
+    return results
+
+def _write(results: List[Dict], out_dir: str):
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "results.json"), "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    wkeys = sorted({k for r in results for k in r["weights"]})
+    cols = ["window_sec", "stride_sec", "iou_thresh", "peak_boost"]
+    with open(os.path.join(out_dir, "results.csv"), "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["rank", "ndcg", "ap", "precision", "recall", "current"] + cols + [f"w_{k}" for k in wkeys])
+        for i, r in enumerate(results, 1):
+            w.writerow([i, r["ndcg"], r["ap"], r["precision"], r["recall"], int(r["current"])]
+                       + [r[c] for c in cols] + [r["weights"].get(k, WEIGHTS[k]) for k in wkeys])
+
+def _describe(r: Dict) -> str:
+    w = " ".join(f"{k}={v:g}" for k, v in sorted(r["weights"].items()))
+    return (f"win={r['window_sec']:g} stride={r['stride_sec']:g} iou={r['iou_thresh']:g} "
+            f"boost={r['peak_boost']:g}" + (f" {w}" if w else ""))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep highlight scoring parameters on cached transcripts")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--show", type=int, default=15, help="print this many of the best configs")
+    args = parser.parse_args()
+    res = run_sweep(args.config, args.workers)
+    print(f"\n{'rank':>4}  {'nDCG':>6} {'AP':>6} {'P@k':>6} {'R@k':>6}  config")
+    for i, r in enumerate(res, 1):
+        if i <= args.show or r["current"]:
+            mark = "  ← current" if r["current"] else ""
+            print(f"{i:>4}  {r['ndcg']:.4f} {r['ap']:.4f} {r['precision']:.4f} {r['recall']:.4f}  {_describe(r)}{mark}")
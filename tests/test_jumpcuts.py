@@ -0,0 +1,29 @@
+import os, re, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+jumpcuts = pytest.importorskip("jumpcuts")
+
+TB = 1 / 90000
+
+def _out_time(filter_str: str, t: float) -> float:
+    """Evaluate the setpts/asetpts expression of a jumpcuts filter for a frame at clip time t."""
+    expr = re.search(r"setpts='([^']*)'", filter_str).group(1)
+    env = {"PTS": t / TB, "T": t, "TB": TB, "gte": lambda a, b: float(a >= b)}
+    return eval(expr, {"__builtins__": {}}, env) * TB
+
+@pytest.mark.parametrize("make", [jumpcuts.video_filter, jumpcuts.audio_filter])
+def test_leading_cut_starts_at_zero_and_matches_captions(make):
+    keeps = [(1.2, 5.0), (6.0, 12.0)]
+    f = make(keeps)
+    for t in (1.2, 3.0, 5.0, 6.0, 9.5, 12.0):
+        assert _out_time(f, t) == pytest.approx(jumpcuts.retime(t, keeps), abs=1e-6)
+
+@pytest.mark.parametrize("make", [jumpcuts.video_filter, jumpcuts.audio_filter])
+def test_no_leading_cut(make):
+    keeps = [(0.0, 4.0), (5.5, 10.0)]
+    f = make(keeps)
+    assert _out_time(f, 0.0) == pytest.approx(0.0)
+    assert _out_time(f, 5.5) == pytest.approx(4.0)
+    assert _out_time(f, 10.0) == pytest.approx(jumpcuts.retime(10.0, keeps))
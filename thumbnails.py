@@ -0,0 +1,176 @@
+# thumbnails.py
+# Cover frame per clip: decode only the keyframes of the highlight range at analysis width,
+# score them all at once (sharpness, faces, exposure, motion), then grab the winner once at
+# full resolution with the clip's framing -> clips/clip_NNN_cover.jpg (moved to output/ with
+# the clip). start_covers() runs it on a background thread while the clips encode.
+
+import os, re, subprocess, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import cv2
+
+import procman
+from clipper import _clip_range, _fit_filter, _reframe_crop, _reframe_enabled, renditions
+from reel import probe_params
+from reframe import face_detector
+
+_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="covers")
+
+def _opts(cfg: Dict) -> Dict:
+    t = cfg.get("thumbnails", {}) or {}
+    w = t.get("weights", {}) or {}
+    return {
+        "enabled": bool(t.get("enabled", True)),
+        "sample": (t.get("sample") or "keyframes").lower(),   # keyframes | fps
+        "sample_fps": float(t.get("sample_fps", 1.0)),
+        "analysis_width": int(t.get("analysis_width", 256)),
+        "edge_margin": float(t.get("edge_margin", 0.5)),     # skip cut/transition frames at the ends
+        "quality": int(t.get("quality", 3)),                 # mjpeg -q:v, 2 (best) .. 31
+        "w_sharp": float(w.get("sharpness", 1.0)),
+        "w_face": float(w.get("face", 1.5)),
+        "w_bright": float(w.get("brightness", 0.7)),
+        "w_motion": float(w.get("motion", 0.6)),
+    }
+
+def _sample(video_path: str, start: float, dur: float, o: Dict) -> Tuple[np.ndarray, List[float]]:
+    """BGR frames (N,h,w,3) at analysis width + clip-relative timestamps."""
+    src = probe_params(video_path).get("video") or {}
+    sw, sh = int(src.get("width") or 0), int(src.get("height") or 0)
+    if not sw or not sh:
+        return np.zeros((0, 1, 1, 3), np.uint8), []
+    aw = o["analysis_width"]
+    ah = max(2, int(round(sh * aw / sw / 2)) * 2)
+    size = aw * ah * 3
+
+    def run(keyframes: bool):
+        cmd = ["ffmpeg","-hide_banner","-nostdin"]
+        if keyframes:
+            cmd += ["-skip_frame","nokey"]
+        cmd += ["-ss", f"{start:.3f}", "-t", f"{dur:.3f}", "-i", video_path, "-an"]
+        vf = f"scale={aw}:{ah}:flags=area,format=bgr24,showinfo"
+        if not keyframes:
+            vf = f"fps={o['sample_fps']}," + vf
+        cmd += ["-vf", vf, "-fps_mode","passthrough", "-f","rawvideo", "pipe:1"]
+        p = procman.run(cmd, duration=dur, timeout_factor=1.0, capture_stdout=True, capture_stderr=True)
+        n = len(p.stdout) // size
+        frames = np.frombuffer(p.stdout[:n*size], np.uint8).reshape(n, ah, aw, 3)
+        times = [float(x) for x in re.findall(rb"pts_time:\s*([0-9.eE+-]+)", p.stderr)][:n]
+        if len(times) < n:
+            times += [times[-1] if times else 0.0] * (n - len(times))
+        return frames, times
+
+    frames, times = run(o["sample"] == "keyframes")
+    if len(frames) < 3 and o["sample"] == "keyframes":
+        frames, times = run(False)   # one long GOP: fall back to a sparse fixed-rate sample
+    return frames, times
+
+def _norm(x: np.ndarray) -> np.ndarray:
+    lo, hi = float(x.min()), float(x.max())
+    return (x - lo) / (hi - lo) if hi - lo > 1e-9 else np.zeros_like(x)
+
+def score_frames(frames: np.ndarray, times: List[float], dur: float, o: Dict) -> np.ndarray:
+    """One score per frame; all terms but face detection are computed on the whole stack at once."""
+    n = len(frames)
+    g = frames.astype(np.float32) @ np.array([0.114, 0.587, 0.299], np.float32)   # BGR -> luma (N,h,w)
+
+    lap = (4 * g[:, 1:-1, 1:-1] - g[:, :-2, 1:-1] - g[:, 2:, 1:-1] - g[:, 1:-1, :-2] - g[:, 1:-1, 2:])
+    sharp = _norm(np.log1p(lap.reshape(n, -1).var(axis=1)))
+
+    mean = g.reshape(n, -1).mean(axis=1) / 255.0
+    clipped = ((g < 8) | (g > 247)).reshape(n, -1).mean(axis=1)
+    bright = np.clip(1.0 - 2.0 * np.abs(mean - 0.5), 0.0, 1.0) * (1.0 - clipped)
+
+    # mean abs difference to the neighbouring samples: cuts, fades and fast pans score high
+    d = np.abs(np.diff(g, axis=0)).reshape(max(0, n - 1), -1).mean(axis=1) / 255.0 if n > 1 else np.zeros(0, np.float32)
+    motion = np.zeros(n, np.float32)
+    if n > 1:
+        motion[:-1] += d
+        motion[1:] += d
+        motion[1:-1] /= 2
+    motion = _norm(motion)
+
+    score = o["w_sharp"] * sharp + o["w_bright"] * bright - o["w_motion"] * motion
+    t = np.asarray(times, np.float32)
+    edge = (t < o["edge_margin"]) | (t > dur - o["edge_margin"])
+    score = np.where(edge & (n > 2), score - 1.0, score)
+
+    # faces add at most w_face, so only frames that could still win get the (slow) detector
+    det = face_detector()
+    if det is None or o["w_face"] <= 0:
+        return score
+    h, w = g.shape[1:]
+    out = score.copy()
+    best = float(score.max())
+    for k in np.argsort(-score):
+        if score[k] + o["w_face"] <= best:
+            break
+        found = det.detectMultiScale(g[k].astype(np.uint8), scaleFactor=1.15, minNeighbors=4,
+                                     minSize=(max(12, w // 20), max(12, w // 20)))
+        if len(found):
+            area = float((found[:, 2] * found[:, 3]).max()) / (w * h)
+            out[k] += o["w_face"] * min(1.0, 0.5 + area * 10.0)   # presence, then size
+            best = max(best, float(out[k]))
+    return out
+
+def _geometry(cfg: Dict) -> Dict:
+    enc = cfg.get("encode", {}) or {}
+    rs = renditions(enc)
+    if rs:
+        return rs[0]
+    return {"width": int(enc.get("width", 1080)), "height": int(enc.get("height", 1920)),
+            "fps": int(enc.get("fps", 60))}
+
+def cover_frame(video_path: str, hl: Dict, i: int, work_dir: str, cfg: Dict) -> Optional[str]:
+    """Pick and write clips/clip_NNN_cover.jpg for one highlight; returns its path."""
+    o = _opts(cfg)
+    if not o["enabled"]:
+        return None
+    enc = cfg.get("encode", {}) or {}
+    s, e, dur = _clip_range(hl, enc)
+    t0 = time.time()
+    frames, times = _sample(video_path, s, dur, o)
+    if len(frames) == 0:
+        return None
+    scores = score_frames(frames, times, dur, o)
+    best = int(np.argmax(scores))
+    t = min(max(0.0, times[best]), dur)
+
+    r = dict(_geometry(cfg))
+    mode = (enc.get("mode") or "nvenc").lower()
+    fit = r.get("fit") or ("reframe" if _reframe_enabled(cfg) and mode != "copy" else "pad")
+    crop = _reframe_crop(video_path, s, e, r["width"], r["height"], work_dir, cfg) if fit == "reframe" else None
+    # the crop path is a function of clip time: re-stamp the single frame at t
+    vf = f"setpts=PTS-STARTPTS+{t:.3f}/TB," + _fit_filter(r, crop)
+
+    clips_dir = os.path.join(work_dir, "clips")
+    os.makedirs(clips_dir, exist_ok=True)
+    out = os.path.join(clips_dir, f"clip_{i:03}_cover.jpg")
+    part = os.path.join(clips_dir, f"clip_{i:03}_cover.part.jpg")
+    procman.run([
+        "ffmpeg","-y","-hide_banner",
+        "-ss", f"{s + t:.3f}", "-i", video_path,
+        "-frames:v","1","-update","1","-an","-vf", vf,
+        "-q:v", str(o["quality"]), part
+    ], timeout=60)
+    os.replace(part, out)
+    print(f"  • clip_{i:03}_cover.jpg  (t={t:.1f}s of {len(frames)} samples)  in {time.time()-t0:.2f}s")
+    return out
+
+def cut_covers(video_path: str, highlights: List[Dict], work_dir: str, cfg: Dict,
+               numbers: Optional[List[int]] = None) -> List[str]:
+    numbers = list(numbers) if numbers else range(1, len(highlights) + 1)
+    out = []
+    for i, hl in zip(numbers, highlights):
+        try:
+            p = cover_frame(video_path, hl, i, work_dir, cfg)
+            if p:
+                out.append(p)
+        except (subprocess.CalledProcessError, OSError, ValueError, cv2.error) as ex:
+            print(f"⚠️ cover for clip_{i:03} skipped: {ex}")
+    return out
+
+def start_covers(video_path: str, highlights: List[Dict], work_dir: str, cfg: Dict,
+                 numbers: Optional[List[int]] = None) -> Future:
+    """cut_covers on the background thread, overlapping the clip encodes."""
+    return _POOL.submit(cut_covers, video_path, highlights, work_dir, cfg, numbers)
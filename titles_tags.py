@@ -1,16 +1,265 @@
-import os
+# titles_tags.py
+# Titles + hashtags for every clip of a run from its transcript excerpt.
+#
+#   - one batched chat request per video (all excerpts at once), cached by excerpt hash in
+#     titles.cache so re-runs / finalize / other nodes don't pay twice
+#   - local template fallback (no key, endpoint down, bad JSON, missing ids)
+#   - start_titles() runs it on a background thread while the clips encode
+#   - titles.base_url (or OPENAI_BASE_URL) points it at any compatible endpoint, e.g. the stub:
+#       python titles_tags.py stub --port 8765
+#       titles: {base_url: "http://127.0.0.1:8765/v1"}
 
-def generate_titles(work_dir, config_path):
+import os, re, json, hashlib, argparse, threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+import yaml
+
+from hook_mixer import content_tokens
+
+PROMPT_VERSION = "v1"
+_CACHE_LOCK = threading.Lock()
+_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="titles")
+_CLIP = re.compile(r"^clip_(\d+)")
+
+def _opts(cfg: Dict) -> Dict:
+    t = cfg.get("titles", {}) or {}
+    return {
+        "mode": (t.get("mode") or "llm").lower(),          # llm | template
+        "model": t.get("model") or (cfg.get("scoring", {}) or {}).get("gpt_model", "gpt-4o-mini"),
+        "base_url": t.get("base_url") or os.getenv("OPENAI_BASE_URL"),
+        "timeout": float(t.get("timeout", 60)),
+        "max_tags": int(t.get("max_tags", 5)),
+        "excerpt_chars": int(t.get("excerpt_chars", 600)),
+        "cache": t.get("cache", os.path.join("work", "_cache", "titles.json")),
+    }
+
+def _excerpt(transcript: List[Dict], start: float, end: float, max_chars: int) -> str:
+    text = " ".join(t["text"].strip() for t in transcript
+                    if float(t["end"]) > start and float(t["start"]) < end).strip()
+    return text[:max_chars]
+
+def _key(o: Dict, excerpt: str) -> str:
+    raw = f"{PROMPT_VERSION}|{o['model']}|{o['max_tags']}|{excerpt}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+# ---- cache (shared JSON file; merged on write so concurrent runs don't drop entries) ----
+
+def _load_cache(path: str) -> Dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(path: str, new: Dict):
+    if not new:
+        return
+    with _CACHE_LOCK:
+        data = _load_cache(path)
+        data.update(new)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+# ---- generators ----
+
+def _hashtag(w: str) -> str:
+    return "#" + re.sub(r"[^0-9a-z]", "", w.lower())
+
+def template_title(excerpt: str, max_tags: int = 5) -> Dict:
+    """Local fallback: first sentence as the title, most frequent content words as tags."""
+    text = excerpt.strip()
+    first = re.split(r"(?<=[.!?])\s+", text, maxsplit=1)[0] if text else ""
+    if len(first) > 70:
+        first = first[:70].rsplit(" ", 1)[0] + "…"
+    title = first[:1].upper() + first[1:] if first else "Watch this"
+    counts = Counter(w for w in content_tokens(text) if len(w) > 3)
+    tags = [_hashtag(w) for w, _ in counts.most_common(max(0, max_tags - 1))]
+    tags = [t for t in tags if len(t) > 1] + ["#shorts"]
+    return {"title": title, "tags": tags, "source": "template"}
+
+def _parse_json(txt: str):
+    txt = txt.strip()
+    if txt.startswith("```"):
+        txt = txt.strip("`")
+        nl = txt.find("\n")
+        if nl != -1 and txt[:nl].lower().startswith("json"):
+            txt = txt[nl+1:]
+    return json.loads(txt)
+
+def _llm_batch(items: Dict[int, str], o: Dict) -> Dict[int, Dict]:
+    """One chat request for every excerpt; returns {id: {title, tags}} for the ids it got back."""
+    from openai import OpenAI
+    api_key = os.getenv("OPENAI_API_KEY") or ("local" if o["base_url"] else None)
+    if not api_key:
+        raise RuntimeError("no OPENAI_API_KEY")
+    client = OpenAI(api_key=api_key, base_url=o["base_url"] or None, timeout=o["timeout"])
+
+    lines = [f"[{i}] {ex}" for i, ex in sorted(items.items())]
+    user_prompt = (
+        "Write a short-form video title (max 70 chars, no clickbait emoji spam) and up to {n} "
+        "hashtags for each clip excerpt below. Return strict JSON: "
+        "{{\"clips\": [{{\"id\": n, \"title\": \"...\", \"tags\": [\"#tag\", ...]}}, ...]}}\n\n"
+        "CLIPS:\n{clips}"
+    ).format(n=o["max_tags"], clips="\n".join(lines))
+    resp = client.chat.completions.create(
+        model=o["model"],
+        messages=[
+            {"role": "system", "content": "Return only JSON, no commentary."},
+            {"role": "user", "content": user_prompt},
+        ],
+        temperature=0.4,
+        max_tokens=60 + 60 * len(items),
+    )
+    arr = _parse_json(resp.choices[0].message.content)
+    if isinstance(arr, dict):
+        arr = arr.get("clips", [])
+    out = {}
+    for it in arr:
+        try:
+            i = int(it["id"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        title = str(it.get("title", "")).strip()
+        if i not in items or not title:
+            continue
+        tags = [_hashtag(t) for t in (it.get("tags") or []) if isinstance(t, str)]
+        out[i] = {"title": title[:100], "tags": [t for t in tags if len(t) > 1][:o["max_tags"]], "source": "llm"}
+    return out
+
+def prepare_titles(work_dir: str, config_path: str, highlights: Optional[List[Dict]] = None,
+                   numbers: Optional[List[int]] = None) -> Dict[int, Dict]:
+    """
+    Title + tags per highlight number, written to <work_dir>/titles.json. Cached entries are
+    reused; the rest go out in a single request, and anything it can't answer gets the template.
+    """
+    with open(config_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    o = _opts(cfg)
+    if highlights is None:
+        with open(os.path.join(work_dir, "highlights.json"), "r", encoding="utf-8") as f:
+            highlights = json.load(f)
+    with open(os.path.join(work_dir, "transcript.json"), "r", encoding="utf-8") as f:
+        transcript = json.load(f)
+    numbers = numbers or list(range(1, len(highlights) + 1))
+
+    excerpts = {n: _excerpt(transcript, float(hl["start"]), float(hl["end"]), o["excerpt_chars"])
+                for n, hl in zip(numbers, highlights)}
+    cache = _load_cache(o["cache"])
+    results, missing = {}, {}
+    for n, ex in excerpts.items():
+        hit = cache.get(_key(o, ex))
+        if hit:
+            results[n] = hit
+        elif ex:
+            missing[n] = ex
+
+    if missing and o["mode"] == "llm":
+        try:
+            got = _llm_batch(missing, o)
+            results.update(got)
+            _save_cache(o["cache"], {_key(o, missing[n]): r for n, r in got.items()})
+        except Exception as e:
+            print(f"⚠️ title request failed ({e}); using templates")
+    for n, ex in excerpts.items():
+        if n not in results:
+            results[n] = template_title(ex, o["max_tags"])
+
+    path = os.path.join(work_dir, "titles.json")
+    merged = {}
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            merged = json.load(f)
+    merged.update({str(n): r for n, r in results.items()})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(merged, f, indent=2, ensure_ascii=False)
+    n_llm = sum(1 for r in results.values() if r.get("source") == "llm")
+    print(f"📝 Titles ready: {n_llm} generated/cached, {len(results) - n_llm} from template")
+    return results
+
+def start_titles(work_dir: str, config_path: str, highlights: List[Dict],
+                 numbers: Optional[List[int]] = None) -> Future:
+    """prepare_titles on the background thread, so the request overlaps the clip encodes."""
+    return _POOL.submit(prepare_titles, work_dir, config_path, highlights, numbers)
+
+def generate_titles(work_dir, config_path, pending: Optional[Future] = None):
+    """Writes <clip>_title.txt (title + hashtags) next to every final clip."""
     print("\n📝 Generating titles...")
+    if pending is not None:
+        try:
+            pending.result()
+        except Exception as e:
+            print(f"⚠️ background titles failed: {e}")
+    path = os.path.join(work_dir, "titles.json")
+    titles = {}
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            titles = json.load(f)
+
     clips_dir = os.path.join(work_dir, "clips")
-    for file in os.listdir(clips_dir):
-        if file.endswith("_final.mp4"):
-            name = file.replace("_final.mp4", "")
-            title_filename = os.path.join(clips_dir, f"{name}_title.txt")
-            count = 1
-            while os.path.exists(title_filename):
-                title_filename = os.path.join(clips_dir, f"{name}_title_{count}.txt")
-                count += 1
-
-            with open(title_filename, "w", encoding="utf-8") as f:
-                f.write(f"🔥 Epic Clip: {name.replace('_', ' ').title()} #viral #shorts")
+    finals = [f for f in sorted(os.listdir(clips_dir)) if f.endswith("_final.mp4")]
+    needed = sorted({int(m.group(1)) for m in map(_CLIP.match, finals)
+                     if m and str(int(m.group(1))) not in titles})
+    if needed:
+        try:
+            with open(os.path.join(work_dir, "highlights.json"), "r", encoding="utf-8") as f:
+                hls = json.load(f)
+            needed = [n for n in needed if 1 <= n <= len(hls)]
+            got = prepare_titles(work_dir, config_path, [hls[n-1] for n in needed], numbers=needed)
+            titles.update({str(n): r for n, r in got.items()})
+        except (OSError, ValueError) as e:
+            print(f"⚠️ titles unavailable ({e}); using clip names")
+
+    for file in finals:
+        name = file.replace("_final.mp4", "")
+        m = _CLIP.match(name)
+        r = titles.get(str(int(m.group(1)))) if m else None
+        if r is None:
+            r = {"title": name.replace("_", " ").title(), "tags": ["#shorts"]}
+        with open(os.path.join(clips_dir, f"{name}_title.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{r['title']}\n{' '.join(r['tags'])}\n")
+
+# --------------------------- local stub endpoint ---------------------------
+
+def serve_stub(port: int = 8765):
+    """Minimal /v1/chat/completions that answers title batches deterministically."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = body.get("messages", [{}])[-1].get("content", "")
+            clips = []
+            for m in re.finditer(r"^\[(\d+)\] (.*)$", prompt, re.M):
+                words = m.group(2).split()
+                clips.append({"id": int(m.group(1)), "title": "Stub: " + " ".join(words[:6]),
+                              "tags": ["#stub"] + ["#" + w.strip(".,!?").lower() for w in words[:2]]})
+            out = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": 0, "model": body.get("model", "stub"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": json.dumps({"clips": clips})}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def log_message(self, fmt, *args):
+            print(f"  • stub: {fmt % args}")
+
+    print(f"🧪 Title stub on http://127.0.0.1:{port}/v1")
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    stub = sub.add_parser("stub", help="Serve a local OpenAI-compatible endpoint for testing")
+    stub.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    if args.cmd == "stub":
+        serve_stub(args.port)
@@ -3,7 +3,7 @@ import os, json, yaml, gc
 import torch
 import whisper  # from openai-whisper
 
-def transcribe_audio(video_path, work_dir, config_path):
+def load_model(config_path):
     with open(config_path, "r", encoding="utf-8") as f:
         cfg = yaml.safe_load(f) or {}
 
@@ -13,35 +13,50 @@ def transcribe_audio(video_path, work_dir, config_path):
     device = "cuda" if torch.cuda.is_available() else "cpu"
     print(f"✅ Using {device.upper()} via PyTorch for transcription")
 
-    model = whisper.load_model(model_size, device=device)
+    return whisper.load_model(model_size, device=device)
+
+def _transcribe(model, path, **kw):
     # deterministic + a bit faster
     result = model.transcribe(
-        video_path,
+        path,
         verbose=False,
         temperature=0.0,
         condition_on_previous_text=False,
         no_speech_threshold=0.6,   # skip low-energy
-        logprob_threshold=-1.0
+        logprob_threshold=-1.0,
+        **kw
     )
-
-    segments = result.get("segments", [])
-    os.makedirs(work_dir, exist_ok=True)
-
-    transcript, srt_lines = [], []
-    for i, seg in enumerate(segments):
+    out = []
+    for seg in result.get("segments", []):
         s, e = float(seg["start"]), float(seg["end"])
         text = (seg.get("text") or "").strip()
-        transcript.append({"start": s, "end": e, "text": text})
-        srt_lines.append(f"{i+1}\n{_fmt(s)} --> {_fmt(e)}\n{text}\n")
+        out.append({"start": s, "end": e, "text": text})
+    return out
 
+def write_transcript(transcript, work_dir):
+    os.makedirs(work_dir, exist_ok=True)
+    srt_lines = [f"{i+1}\n{_fmt(t['start'])} --> {_fmt(t['end'])}\n{t['text']}\n" for i, t in enumerate(transcript)]
     with open(os.path.join(work_dir, "transcript.json"), "w", encoding="utf-8") as f:
         json.dump(transcript, f, indent=2, ensure_ascii=False)
     with open(os.path.join(work_dir, "transcript.srt"), "w", encoding="utf-8") as f:
         f.write("\n".join(srt_lines))
 
+def transcribe_audio(video_path, work_dir, config_path):
+    model = load_model(config_path)
+    transcript = _transcribe(model, video_path)
+    write_transcript(transcript, work_dir)
+
     del model; gc.collect()
     return transcript
 
+def transcribe_chunk(model, audio_path, offset=0.0, prompt=None):
+    """Transcribe one audio chunk; times are shifted by offset (source seconds)."""
+    segs = _transcribe(model, audio_path, initial_prompt=prompt or None)
+    for s in segs:
+        s["start"] += offset
+        s["end"] += offset
+    return segs
+
 def _fmt(t):
     h = int(t // 3600); m = int((t % 3600) // 60); s = int(t % 60)
     ms = int(round((t - int(t)) * 1000))
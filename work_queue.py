@@ -0,0 +1,322 @@
+# work_queue.py
+# Lease-based job queue on a shared filesystem (NFS or a plain local dir as a stand-in broker).
+#
+# Layout under <root>:
+#   jobs/<id>.json      immutable job spec (written once by enqueue)
+#   leases/<id>.lease   current owner + token; created with O_EXCL, its mtime is the heartbeat
+#   done/<id>.json      completion marker (result summary)
+#   failed/<id>.json    last error; the job is retried until max_attempts
+#
+# Claiming is O_EXCL create of the lease file. A lease not touched for lease_sec can be
+# stolen by any node: the stale lease is renamed aside (only one node wins the rename),
+# verified to be the one we saw and still stale, and then re-created exclusively. Nothing
+# is ever renamed over a lease: a lease moved aside by mistake goes back with link(),
+# which fails instead of clobbering one a third node created in the gap, and heartbeats
+# only touch the mtime, so a heartbeat racing a steal extends the new lease, never replaces it.
+
+import os, json, time, uuid, socket, threading
+from typing import Dict, List, Optional
+
+def _now() -> float:
+    return time.time()
+
+def _write_json_atomic(path: str, obj: Dict):
+    tmp = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+class LeaseLost(Exception):
+    pass
+
+class Lease:
+    """
+    Held job. Heartbeats run on a daemon thread until release()/complete()/fail().
+    Use as a context manager: an exception inside the block marks the job failed.
+    """
+    def __init__(self, queue: "WorkQueue", job: Dict, token: str):
+        self.queue = queue
+        self.job = job
+        self.token = token
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+        self._thread.start()
+
+    @property
+    def id(self) -> str:
+        return self.job["id"]
+
+    def _beat(self):
+        while not self._stop.wait(self.queue.heartbeat_sec):
+            try:
+                self.queue._heartbeat(self.id, self.token)
+            except LeaseLost:
+                self.lost = True
+                print(f"⚠️ lease lost for {self.id} (stolen after expiry)")
+                return
+            except OSError as e:
+                print(f"⚠️ heartbeat failed for {self.id}: {e}")
+
+    def verify(self):
+        """Raise LeaseLost unless this node still holds the job; call right before publishing output."""
+        if self.lost or not self.queue._owned(self.id, self.token):
+            self.lost = True
+            raise LeaseLost(self.id)
+
+    def _stop_beat(self):
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    def complete(self, result: Optional[Dict] = None):
+        self._stop_beat()
+        self.queue._complete(self.id, self.token, result or {})
+
+    def fail(self, error: str):
+        self._stop_beat()
+        self.queue._fail(self.id, self.token, error)
+
+    def release(self):
+        self._stop_beat()
+        self.queue._release(self.id, self.token)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._stop.is_set():
+            return False
+        if self.lost or isinstance(exc, LeaseLost):
+            # the stealer owns the job (and its outcome) now
+            self._stop_beat()
+            print(f"⚠️ {self.id}: lease lost; leaving the job to its new owner")
+            return isinstance(exc, LeaseLost)
+        if exc is None:
+            self.complete()
+        else:
+            self.fail(f"{exc_type.__name__}: {exc}")
+        return False
+
+class WorkQueue:
+    def __init__(self, root: str, lease_sec: float = 60.0, heartbeat_sec: float = 15.0,
+                 max_attempts: int = 3, owner: Optional[str] = None):
+        self.root = root
+        self.lease_sec = float(lease_sec)
+        self.heartbeat_sec = float(heartbeat_sec)
+        self.max_attempts = int(max_attempts)
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        for sub in ("jobs", "leases", "done", "failed"):
+            os.makedirs(os.path.join(root, sub), exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg: Dict) -> "WorkQueue":
+        q = cfg.get("queue", {}) or {}
+        return cls(
+            root=q.get("root", os.path.join("work", "_queue")),
+            lease_sec=float(q.get("lease_sec", 60)),
+            heartbeat_sec=float(q.get("heartbeat_sec", 15)),
+            max_attempts=int(q.get("max_attempts", 3)),
+        )
+
+    # ---- paths ----
+    def _job_path(self, jid):   return os.path.join(self.root, "jobs", f"{jid}.json")
+    def _lease_path(self, jid): return os.path.join(self.root, "leases", f"{jid}.lease")
+    def _done_path(self, jid):  return os.path.join(self.root, "done", f"{jid}.json")
+    def _fail_path(self, jid):  return os.path.join(self.root, "failed", f"{jid}.json")
+
+    # ---- producer side ----
+    def enqueue(self, jid: str, kind: str, payload: Dict, priority: int = 0) -> bool:
+        """Idempotent: re-enqueueing an existing or finished job id is a no-op."""
+        path = self._job_path(jid)
+        if os.path.exists(path) or os.path.exists(self._done_path(jid)):
+            return False
+        job = {"id": jid, "kind": kind, "priority": int(priority), "created": _now(), **payload}
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        return True
+
+    # ---- state ----
+    def is_done(self, jid: str) -> bool:
+        return os.path.exists(self._done_path(jid))
+
+    def attempts(self, jid: str) -> int:
+        info = _read_json(self._fail_path(jid)) or {}
+        return int(info.get("attempts", 0))
+
+    def is_dead(self, jid: str) -> bool:
+        return self.attempts(jid) >= self.max_attempts
+
+    def job_ids(self, prefix: str = "") -> List[str]:
+        names = os.listdir(os.path.join(self.root, "jobs"))
+        return sorted(n[:-5] for n in names if n.endswith(".json") and n.startswith(prefix))
+
+    def pending(self, prefix: str = "") -> List[str]:
+        return [j for j in self.job_ids(prefix) if not self.is_done(j) and not self.is_dead(j)]
+
+    def load_job(self, jid: str) -> Optional[Dict]:
+        return _read_json(self._job_path(jid))
+
+    # ---- leasing ----
+    def _create_lease(self, jid: str, token: str) -> bool:
+        path = self._lease_path(jid)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"owner": self.owner, "token": token, "lease_sec": self.lease_sec}, f)
+        return True
+
+    def _stale(self, path: str, lease: Optional[Dict]) -> bool:
+        try:
+            age = _now() - os.path.getmtime(path)
+        except FileNotFoundError:
+            return True
+        return age >= float((lease or {}).get("lease_sec", self.lease_sec))
+
+    def _put_back(self, aside: str, path: str):
+        """Undo a rename-aside without replacing a lease someone created meanwhile."""
+        try:
+            os.link(aside, path)
+        except FileExistsError:
+            pass
+        try:
+            os.remove(aside)
+        except FileNotFoundError:
+            pass
+
+    def _steal_if_expired(self, jid: str) -> bool:
+        """Move an expired lease out of the way. Returns True if the slot is now free."""
+        path = self._lease_path(jid)
+        cur = _read_json(path)
+        # an unreadable/half-written lease is judged by its mtime as well
+        if not self._stale(path, cur):
+            return False
+        aside = f"{path}.stale-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return True
+        moved = _read_json(aside)
+        if (moved or {}).get("token") != (cur or {}).get("token") or not self._stale(aside, moved):
+            # raced with another stealer who re-leased it, or with the owner's heartbeat
+            self._put_back(aside, path)
+            return False
+        try:
+            os.remove(aside)
+        except FileNotFoundError:
+            pass
+        if cur is not None:
+            print(f"♻️ stealing expired lease {jid} (was {cur.get('owner')})")
+        return True
+
+    def try_claim(self, jid: str) -> Optional[Lease]:
+        if self.is_done(jid) or self.is_dead(jid):
+            return None
+        job = self.load_job(jid)
+        if job is None:
+            return None
+        token = uuid.uuid4().hex
+        if not self._create_lease(jid, token):
+            if not self._steal_if_expired(jid) or not self._create_lease(jid, token):
+                return None
+        if self.is_done(jid):
+            # finished between our check and the claim
+            self._release(jid, token)
+            return None
+        return Lease(self, job, token)
+
+    def claim_next(self, kinds: Optional[List[str]] = None, prefix: str = "") -> Optional[Lease]:
+        jobs = []
+        for jid in self.pending(prefix):
+            job = self.load_job(jid)
+            if job and (not kinds or job.get("kind") in kinds):
+                jobs.append(job)
+        kind_rank = {k: i for i, k in enumerate(kinds or [])}
+        jobs.sort(key=lambda j: (kind_rank.get(j.get("kind"), 0), -j.get("priority", 0), j.get("created", 0)))
+        for job in jobs:
+            lease = self.try_claim(job["id"])
+            if lease is not None:
+                return lease
+        return None
+
+    def _owned(self, jid: str, token: str) -> bool:
+        cur = _read_json(self._lease_path(jid))
+        return bool(cur) and cur.get("token") == token
+
+    def _heartbeat(self, jid: str, token: str):
+        if not self._owned(jid, token):
+            raise LeaseLost(jid)
+        try:
+            os.utime(self._lease_path(jid), None)
+        except FileNotFoundError:
+            raise LeaseLost(jid)
+
+    def _release(self, jid: str, token: str):
+        if not self._owned(jid, token):
+            return
+        path = self._lease_path(jid)
+        aside = f"{path}.release-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(path, aside)
+        except FileNotFoundError:
+            return
+        if (_read_json(aside) or {}).get("token") != token:
+            self._put_back(aside, path)   # stolen since the check: not ours to remove
+            return
+        try:
+            os.remove(aside)
+        except FileNotFoundError:
+            pass
+
+    def _complete(self, jid: str, token: str, result: Dict):
+        # outputs are published only after Lease.verify(); a late done marker is harmless
+        _write_json_atomic(self._done_path(jid), {"owner": self.owner, "finished": _now(), **result})
+        self._release(jid, token)
+
+    def _fail(self, jid: str, token: str, error: str):
+        n = self.attempts(jid) + 1
+        _write_json_atomic(self._fail_path(jid),
+                           {"owner": self.owner, "attempts": n, "error": error, "at": _now()})
+        print(f"❌ job {jid} failed (attempt {n}/{self.max_attempts}): {error}")
+        self._release(jid, token)
+
+    def wait_for(self, jids: List[str], poll_sec: float = 2.0, handler=None) -> bool:
+        """
+        Block until all jids are done. While waiting, work-steal any of them that are
+        pending or whose lease expired (run through handler(job, lease)). Returns False if one is dead.
+        """
+        while True:
+            left = [j for j in jids if not self.is_done(j)]
+            if not left:
+                return True
+            if any(self.is_dead(j) for j in left):
+                return False
+            progressed = False
+            if handler is not None:
+                for jid in left:
+                    lease = self.try_claim(jid)
+                    if lease is None:
+                        continue
+                    try:
+                        with lease:
+                            handler(lease.job, lease)
+                    except Exception:
+                        pass  # recorded in failed/ by the lease; retried until dead
+                    progressed = True
+            if not progressed:
+                time.sleep(poll_sec)